@@ -4,7 +4,10 @@
 
 import numpy as np
 import copy
+import warnings
+import collections
 from scipy.optimize import curve_fit
+from scipy import sparse
 from .model_functions import fwhmVoigt
 
 
@@ -165,7 +168,8 @@ def shift(x, y, shift, mode='hard'):
 
     Args:
         x (list or array): 1D array.
-        y (list or array): 1D array.
+        y (list or array): 1D array. For ``mode='interp'``, y can also be a
+            stack of curves (last axis corresponds to x).
         shift (float or int): shift value.
         mode (string, optional): If ``mode='x'`` or ``mode='hard'``, y is fully preserved
             while x is shifted. If ``mode='y'``, ``'interp'``, or ``'soft'``, x is preserved
@@ -187,7 +191,7 @@ def shift(x, y, shift, mode='hard'):
     y = copy.deepcopy(np.array(y))
 
     if mode == 'y' or mode == 'interp' or mode=='soft':
-        y = np.interp(x, x + shift, y)
+        y = resample(x + shift, y, x, cache=False)
 
     elif mode == 'x' or mode == 'hard':
         x = np.array(x) + shift
@@ -206,10 +210,158 @@ def shift(x, y, shift, mode='hard'):
 
     return x, y
 
-def movingaverage(array, window_size, remove_boundary_effects=True):
+def _window_sides(window_size):
+    """Returns the number of points on the left and right of the window center.
+
+    The alignment is the same as ``np.convolve(..., mode='same')``.
+    """
+    left = int(window_size)//2
+    return left, int(window_size) - 1 - left
+
+
+def _pad_last_axis(array, left, right, mode, fill=0):
+    """Pad the last axis of an array (see :py:func:`moving_window`)."""
+    pad_width = [(0, 0)]*(array.ndim-1) + [(left, right)]
+    if mode == 'reflect':
+        return np.pad(array, pad_width, mode='reflect')
+    return np.pad(array, pad_width, mode='constant', constant_values=fill)
+
+
+def _savgol_matrix(window_size, polyorder, deriv=0, delta=1):
+    """Returns the Savitzky–Golay projection matrix for a window.
+
+    Row ``t`` of the returned ``(window_size, window_size)`` matrix gives the
+    weights that evaluate (the ``deriv``-th derivative of) the least squares
+    polynomial at position ``t`` of the window. The central row is the usual
+    Savitzky–Golay kernel.
+    """
+    t = np.arange(window_size, dtype=float) - window_size//2
+    powers = np.arange(polyorder+1)
+    vander = t[:, None]**powers
+
+    factor = np.ones(polyorder+1)
+    for i in range(deriv):
+        factor = factor*np.clip(powers-i, 0, None)
+    evaluate = factor*np.where(powers >= deriv, t[:, None], 1)**np.clip(powers-deriv, 0, None)
+
+    return evaluate @ np.linalg.pinv(vander) / delta**deriv
+
+
+def moving_window(array, window_size, statistic='mean', mode='same', axis=-1, polyorder=2, deriv=0, delta=1):
+    """Returns a moving window statistic of an array.
+
+    All statistics share the same core: the data is padded according to
+    ``mode`` and then processed along ``axis`` in a single vectorized pass.
+    The moving average is computed from cumulative sums, so its cost does not
+    depend on ``window_size``. Other statistics are computed on a
+    ``np.lib.stride_tricks.sliding_window_view`` of the data (no copies).
+
+    Args:
+        array (list or np.array): array. Multidimensional arrays (e.g. a stack
+            of spectra) are processed along ``axis``.
+        window_size (int): number of points in the window. For even window
+            sizes, the window has one more point on the left of the center
+            (same as ``np.convolve(..., mode='same')``).
+        statistic (str, optional): ``'mean'``, ``'median'``, ``'max'``, ``'min'``,
+            or ``'savgol'`` (Savitzky–Golay filter, ``window_size`` must be odd).
+        mode (str, optional): how to deal with boundaries.
+
+            * ``'valid'``: only points where the window fully overlaps with the
+              data are returned (length ``n - window_size + 1``). Arrays
+              shorter than ``window_size`` raise a ValueError.
+
+            * ``'same'``: data is padded with zeros (same as ``np.convolve``).
+
+            * ``'reflect'``: data is padded with its reflection about the edge points.
+
+            * ``'shrink'``: the window is reduced at the edges, i.e., only
+              existing points are used. For ``statistic='savgol'``, the
+              polynomial fitted to the first (last) full window is used
+              (arrays shorter than ``window_size`` raise a ValueError).
+
+        axis (int, optional): axis along which the window moves.
+        polyorder (int, optional): polynomial order for ``statistic='savgol'``.
+        deriv (int, optional): derivative order for ``statistic='savgol'``.
+        delta (float, optional): x spacing for ``statistic='savgol'`` (only
+            used if ``deriv > 0``).
+
+    Returns:
+        array.
+
+    See Also:
+        :py:func:`movingaverage`
+    """
+    if int(window_size) != window_size or window_size < 1:
+        raise ValueError('window_size must be a positive integer (>= 1).')
+    window_size = int(window_size)
+    if mode not in ('valid', 'same', 'reflect', 'shrink'):
+        raise ValueError("mode must be 'valid', 'same', 'reflect', or 'shrink'.")
+    if statistic not in ('mean', 'median', 'max', 'min', 'savgol'):
+        raise ValueError("statistic must be 'mean', 'median', 'max', 'min', or 'savgol'.")
+
+    array = np.asarray(array)
+    if not np.issubdtype(array.dtype, np.inexact):
+        array = array.astype(float)
+    array = np.moveaxis(array, axis, -1)
+    n = array.shape[-1]
+    left, right = _window_sides(window_size)
+    if n < window_size and (mode == 'valid' or (mode == 'shrink' and statistic == 'savgol')):
+        raise ValueError(f"array length ({n}) must be at least window_size ({window_size}) for mode='{mode}' and statistic='{statistic}'.")
+
+    if mode == 'valid':
+        padded = array
+    elif mode == 'shrink' and statistic in ('median', 'max', 'min'):
+        padded = _pad_last_axis(array, left, right, mode, fill=np.nan)
+    elif mode == 'shrink' and statistic == 'savgol':
+        padded = array
+    else:
+        padded = _pad_last_axis(array, left, right, mode)
+
+    if statistic == 'mean':
+        # cumulative sums are taken in double precision around a reference
+        # value, otherwise rounding errors build up along the array
+        dtype = np.result_type(padded.dtype, np.float64)
+        reference = np.zeros(padded.shape[:-1] + (1, ), dtype=dtype)
+        if n > 0:
+            reference = np.mean(array, axis=-1, keepdims=True, dtype=dtype)
+            reference[~np.isfinite(reference)] = 0
+        c = np.cumsum(padded - reference, axis=-1, dtype=dtype)
+        c = np.concatenate([np.zeros_like(c[..., :1]), c], axis=-1)
+        final = c[..., window_size:] - c[..., :-window_size] + reference*window_size
+        if mode == 'shrink':
+            i = np.arange(n)
+            final = final/(np.minimum(i+right, n-1) - np.maximum(i-left, 0) + 1)
+        else:
+            final = final/window_size
+        final = final.astype(array.dtype, copy=False)
+    elif statistic == 'savgol':
+        if window_size % 2 == 0:
+            raise ValueError("window_size must be odd for statistic='savgol'.")
+        if polyorder >= window_size:
+            raise ValueError('polyorder must be less than window_size.')
+        matrix = _savgol_matrix(window_size, polyorder, deriv, delta)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window_size, axis=-1)
+        final = windows @ matrix[left]
+        if mode == 'shrink':
+            final = np.concatenate([array[..., :window_size] @ matrix[:left].T,
+                                    final,
+                                    array[..., -window_size:] @ matrix[left+1:].T], axis=-1)
+    else:
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window_size, axis=-1)
+        function = {'median': np.median, 'max': np.max, 'min': np.min}[statistic]
+        if mode == 'shrink':
+            function = {'median': np.nanmedian, 'max': np.nanmax, 'min': np.nanmin}[statistic]
+        final = function(windows, axis=-1)
+
+    return np.moveaxis(final, -1, axis)
+
+
+def movingaverage(array, window_size, mode='shrink', axis=-1, remove_boundary_effects=None):
     """Returns the moving average of an array.
 
-    The returned array has the same length of the original array.
+    The moving average is computed from cumulative sums, so it runs in O(n)
+    regardless of ``window_size``. Except for ``mode='valid'``, the returned
+    array has the same length of the original array.
 
     Example:
         >>> print(manip.movingaverage([0,1,2,3,4,5,6,7,8,9], 1))
@@ -217,123 +369,524 @@ def movingaverage(array, window_size, remove_boundary_effects=True):
         >>> print(manip.movingaverage([0, 1, 2, 3, 4, 5, 6, 7, 8, 9], 2))
         [0. , 0.5, 1.5, 2.5, 3.5, 4.5, 5.5, 6.5, 7.5, 8.5]
         >>> print(manip.movingaverage([0, 1, 2, 3, 4, 5, 6, 7, 8, 9], 3))
+        [0.5 1. 2. 3. 4. 5. 6. 7. 8. 8.5]
+        >>> print(manip.movingaverage([0, 1, 2, 3, 4, 5, 6, 7, 8, 9], 3, mode='same'))
         [0.33333333 1. 2. 3. 4. 5. 6.  7. 8. 5.66666667]
-        >>> print(manip.movingaverage([0, 1, 2, 3, 4, 5, 6, 7, 8, 9], 4))
-        [0.25 0.75 1.5  2.5  3.5  4.5  5.5  6.5  7.5  6.  ]
 
     Warning:
-        Note by the example that the resulting array contains boundary effects.
+        Note by the example that ``mode='same'`` contains boundary effects. The
+        default ``mode='shrink'`` (or ``mode='reflect'``) avoids them.
 
     Args:
         array (list or np.array): array.
         window_size (int): number of points to average.
+        mode (str, optional): ``'valid'``, ``'same'``, ``'reflect'``, or
+            ``'shrink'``. See :py:func:`moving_window`. Default is ``'shrink'``.
+        axis (int, optional): axis along which to average.
+        remove_boundary_effects (bool, optional): deprecated. ``True`` is the
+            same as ``mode='shrink'`` and ``False`` is the same as
+            ``mode='same'``.
 
     Returns:
         array.
+
+    See Also:
+        :py:func:`moving_window`
     """
-    if window_size < 1:
-        raise ValueError('window_size must be a positive integer (> 1).')
+    if remove_boundary_effects is not None:
+        warnings.warn("remove_boundary_effects is deprecated. Use mode='shrink' instead.", DeprecationWarning)
+        mode = 'shrink' if remove_boundary_effects else 'same'
+    return moving_window(array, window_size, statistic='mean', mode=mode, axis=axis)
 
-    array = np.array(array)
-    window = np.ones(int(window_size))/float(window_size)
-    final = np.convolve(array, window, 'same')
 
-    if remove_boundary_effects:
-        final = final[int(window_size/2):]
-    return final
+_grid_cache = collections.OrderedDict()
+_grid_cache_size = 32
+
+
+def _cache_get(key, grids):
+    """Returns a value stored by :py:func:`_cache_set` or None if not found."""
+    key = key + tuple((len(g), hash(g.tobytes())) for g in grids)
+    if key in _grid_cache:
+        stored = _grid_cache[key]
+        if all(np.array_equal(a, b) for a, b in zip(stored[0], grids)):
+            _grid_cache.move_to_end(key)
+            return stored[1]
+    return None
 
 
-def derivative(x, y, order=1, window_size=1):
-    """ if window_size > 1, boundary effects might be """
+def _cache_set(key, grids, value):
+    """Store a value computed for a set of grids (least recently used are dropped)."""
+    key = key + tuple((len(g), hash(g.tobytes())) for g in grids)
+    _grid_cache[key] = ([g.copy() for g in grids], value)
+    if len(_grid_cache) > _grid_cache_size:
+        _grid_cache.popitem(last=False)
 
-    if order<0:
+
+def _fornberg(z, stencil, order):
+    """Returns finite difference weights for the ``order``-th derivative.
+
+    Fornberg's algorithm (Math. Comp. 51, 699 (1988)), vectorized over the
+    evaluation points.
+
+    Args:
+        z (np.array): evaluation points with shape ``(n, )``.
+        stencil (np.array): stencil points for each evaluation point with shape ``(n, m)``.
+        order (int): derivative order.
+
+    Returns:
+        weights with shape ``(n, m)``.
+    """
+    n, m = stencil.shape
+    c = np.zeros((n, m, order+1))
+    c[:, 0, 0] = 1
+    c1 = np.ones(n)
+    c4 = stencil[:, 0] - z
+    for i in range(1, m):
+        mn = min(i, order)
+        c2 = np.ones(n)
+        c5 = c4
+        c4 = stencil[:, i] - z
+        for j in range(i):
+            c3 = stencil[:, i] - stencil[:, j]
+            c2 = c2*c3
+            if j == i-1:
+                for k in range(mn, 0, -1):
+                    c[:, i, k] = c1*(k*c[:, i-1, k-1] - c5*c[:, i-1, k])/c2
+                c[:, i, 0] = -c1*c5*c[:, i-1, 0]/c2
+            for k in range(mn, 0, -1):
+                c[:, j, k] = (c4*c[:, j, k] - k*c[:, j, k-1])/c3
+            c[:, j, 0] = c4*c[:, j, 0]/c3
+        c1 = c2
+    return c[:, :, order]
+
+
+def derivative_stencil(x, order=1, accuracy=2, cache=True):
+    """Returns finite difference stencils for every point of a (non-uniform) grid.
+
+    Stencils are centered at each point and shifted inwards at the edges, so
+    the derivative is defined for every point of ``x``. Weights are computed
+    by Fornberg's algorithm, which is exact for polynomials up to degree
+    ``npoints - 1`` for any grid spacing.
+
+    Args:
+        x (list or array): 1d array (grid). Must not have repeated values.
+        order (int, optional): derivative order.
+        accuracy (int, optional): accuracy order for an uniform grid (must be even).
+        cache (bool, optional): if True, stencils are stored and reused for
+            subsequent calls with the same grid.
+
+    Returns:
+        index and weights arrays with shape ``(len(x), npoints)``, such that
+        ``dy = np.sum(y[index]*weights, axis=-1)``.
+    """
+    if order < 1 or int(order) != order:
         raise ValueError('order must be a positive integer.')
+    if accuracy < 2 or accuracy % 2 != 0:
+        raise ValueError('accuracy must be a positive even integer.')
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    npoints = 2*((order+1)//2) - 1 + accuracy
+    if npoints > n:
+        raise ValueError(f'x must have at least {npoints} points for order={order} and accuracy={accuracy}.')
 
-    x = np.array(x)
-    y = np.array(y)
+    if cache:
+        stored = _cache_get(('stencil', order, accuracy), (x, ))
+        if stored is not None:
+            return stored
 
-    x_diff = np.diff(x)
-    y_diff = np.diff(y)/x_diff
-    for i in range(order-1):
-        y_diff = np.diff(y_diff)/x_diff[:len(x_diff)-(i+1)]
+    start = np.clip(np.arange(n) - npoints//2, 0, n-npoints)
+    idx = start[:, None] + np.arange(npoints)
+    weights = _fornberg(x, x[idx], order)
 
+    if cache:
+        _cache_set(('stencil', order, accuracy), (x, ), (idx, weights))
+    return idx, weights
 
-    i = int(order/2)
-    f = - int(order/2)
-    if (order % 2) != 0:
-        f -= 1
 
-    if window_size>1:
-        x = movingaverage(x, window_size=window_size)
-        y_diff = movingaverage(y_diff, window_size=window_size)
+def derivative(x, y, order=1, window_size=None, method='fornberg', accuracy=2, polyorder=None, axis=-1, cache=True):
+    """Returns the derivative of y with respect to x.
 
-    return x[i: f], y_diff
+    Args:
+        x (list or array): 1d array. It does not need to be uniformly spaced
+            for ``method='fornberg'``.
+        y (list or array): array. If multidimensional (e.g. a stack of spectra),
+            the derivative is calculated along ``axis``.
+        order (int, optional): derivative order.
+        window_size (int, optional): if ``method='fornberg'`` and
+            ``window_size > 1``, x and y are smoothed by the same moving average
+            (``mode='shrink'``) before differentiating. If ``method='savgol'``,
+            number of points of the Savitzky–Golay filter (must be odd and
+            larger than ``polyorder``). If None, no smoothing is applied
+            (``method='fornberg'``) or the smallest valid window is used
+            (``method='savgol'``).
+        method (str, optional): ``'fornberg'`` for finite difference stencils
+            on arbitrary grids, or ``'savgol'`` for a Savitzky–Golay filter
+            (x must be uniformly spaced).
+        accuracy (int, optional): accuracy order of the finite difference
+            stencils (``method='fornberg'``).
+        polyorder (int, optional): polynomial order for ``method='savgol'``. If
+            ``None``, ``order + 1`` is used.
+        axis (int, optional): axis of y along which to differentiate.
+        cache (bool, optional): if True, finite difference stencils are reused
+            between calls with the same x (``method='fornberg'``).
 
-def sort(ref, *args):
-    """Returns sorted arrays based on a reference array."""
-    s = []
-    for x in args:
-        s.append( [x1 for (y,x1) in sorted(zip(ref,x), key=lambda pair: pair[0])])
+    Returns:
+        x and derivative arrays (same length as the input arrays).
+
+    See Also:
+        :py:func:`derivative_stencil`, :py:func:`moving_window`
+    """
+    if order < 1 or int(order) != order:
+        raise ValueError('order must be a positive integer.')
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y)
+    if y.shape[axis] != len(x):
+        raise ValueError('x and y must have the same length along axis.')
+
+    if method == 'savgol':
+        if polyorder is None:
+            polyorder = order + 1
+        if window_size is None:
+            window_size = polyorder + 1 + polyorder % 2
+        elif window_size <= polyorder:
+            raise ValueError(f"window_size must be larger than polyorder ({polyorder}) for method='savgol'.")
+        delta = (x[-1] - x[0])/(len(x) - 1)
+        if not np.allclose(np.diff(x), delta, rtol=1e-6, atol=0):
+            raise ValueError("x must be uniformly spaced for method='savgol'.")
+        dy = moving_window(y, window_size, statistic='savgol', mode='shrink', axis=axis, polyorder=polyorder, deriv=order, delta=delta)
+        return x, dy
+    elif method != 'fornberg':
+        raise ValueError("method must be 'fornberg' or 'savgol'.")
+
+    if window_size is not None and window_size > 1:
+        x = movingaverage(x, window_size, mode='shrink')
+        y = movingaverage(y, window_size, mode='shrink', axis=axis)
+        cache = False
+
+    idx, weights = derivative_stencil(x, order=order, accuracy=accuracy, cache=cache)
+
+    y = np.moveaxis(y, axis, -1)
+    dy = np.zeros(y.shape, dtype=np.result_type(y, weights))
+    for k in range(idx.shape[1]):
+        dy += weights[:, k]*y[..., idx[:, k]]
+
+    return x, np.moveaxis(dy, -1, axis)
+
+
+def _apply_matrix(matrix, y, axis=-1):
+    """Apply a (sparse) matrix to all 1d slices of y along axis in one operation."""
+    y = np.moveaxis(np.asarray(y), axis, 0)
+    shape = y.shape
+    final = matrix @ y.reshape(shape[0], -1)
+    return np.moveaxis(final.reshape((matrix.shape[0], ) + shape[1:]), 0, axis)
+
+
+def bin_edges(x):
+    """Returns bin edges for bin centers x.
+
+    Edges are placed halfway between centers. The first and last edges are
+    placed at half spacing from the first and last centers.
+
+    Args:
+        x (list or array): increasing 1d array with bin centers.
+
+    Returns:
+        array with ``len(x) + 1`` elements.
+    """
+    x = np.asarray(x, dtype=float)
+    if len(x) < 2:
+        raise ValueError('x must have at least 2 points.')
+    edges = np.empty(len(x)+1)
+    edges[1:-1] = (x[1:] + x[:-1])/2
+    edges[0] = x[0] - (x[1] - x[0])/2
+    edges[-1] = x[-1] + (x[-1] - x[-2])/2
+    return edges
+
+
+def interp_matrix(x, x_new, kind='linear', cache=True):
+    """Returns a sparse matrix that interpolates data from x onto x_new.
+
+    The interpolation weights are computed once (``np.searchsorted`` plus
+    Lagrange weights of the 2 or 4 surrounding points) so that
+    ``interp_matrix(x, x_new) @ y`` is equivalent to ``np.interp(x_new, x, y)``.
+    The same matrix can be applied to a whole stack of curves measured on x.
+
+    Note:
+        Points of x_new outside x receive the value of the closest edge point
+        (same as ``np.interp``).
+
+    Args:
+        x (list or array): increasing 1d array (source grid).
+        x_new (list or array): 1d array (target grid).
+        kind (str, optional): ``'linear'`` or ``'cubic'`` (local 4-point
+            Lagrange interpolation, which works on non-uniform grids).
+        cache (bool, optional): if True, matrices are stored and reused for
+            subsequent calls with the same pair of grids.
+
+    Returns:
+        scipy.sparse.csr_matrix with shape ``(len(x_new), len(x))``.
+
+    See Also:
+        :py:func:`resample`
+    """
+    if kind not in ('linear', 'cubic'):
+        raise ValueError("kind must be 'linear' or 'cubic'.")
+    x = np.asarray(x, dtype=float)
+    x_new = np.asarray(x_new, dtype=float)
+    npoints = min(2 if kind == 'linear' else 4, len(x))
+
+    if cache:
+        stored = _cache_get(('interp', kind), (x, x_new))
+        if stored is not None:
+            return stored
+
+    z = np.clip(x_new, x[0], x[-1])
+    start = np.clip(np.searchsorted(x, z, side='right') - npoints//2, 0, len(x)-npoints)
+    idx = start[:, None] + np.arange(npoints)
+    weights = _fornberg(z, x[idx], 0)
+    rows = np.repeat(np.arange(len(x_new)), npoints)
+    matrix = sparse.csr_matrix((weights.ravel(), (rows, idx.ravel())), shape=(len(x_new), len(x)))
+
+    if cache:
+        _cache_set(('interp', kind), (x, x_new), matrix)
+    return matrix
+
+
+def rebin_matrix(x, x_new, cache=True):
+    """Returns a sparse matrix that rebins data from x onto x_new conserving flux.
+
+    Each element is the fraction of the target bin covered by a source bin,
+    so that the integral of the data (sum of ``y*bin_width``) is conserved
+    within the overlapping range.
+
+    Args:
+        x (list or array): increasing 1d array with source bin centers.
+        x_new (list or array): increasing 1d array with target bin centers.
+        cache (bool, optional): if True, matrices are stored and reused for
+            subsequent calls with the same pair of grids.
+
+    Returns:
+        scipy.sparse.csr_matrix with shape ``(len(x_new), len(x))``.
+
+    See Also:
+        :py:func:`rebin`, :py:func:`bin_edges`
+    """
+    x = np.asarray(x, dtype=float)
+    x_new = np.asarray(x_new, dtype=float)
+
+    if cache:
+        stored = _cache_get(('rebin', ), (x, x_new))
+        if stored is not None:
+            return stored
+
+    edges = bin_edges(x)
+    edges_new = bin_edges(x_new)
+
+    # split the common range into segments where a single pair of bins overlap
+    points = np.union1d(edges, edges_new)
+    points = points[np.logical_and(points >= max(edges[0], edges_new[0]), points <= min(edges[-1], edges_new[-1]))]
+    middle = (points[1:] + points[:-1])/2
+    length = np.diff(points)
+    col = np.searchsorted(edges, middle) - 1
+    row = np.searchsorted(edges_new, middle) - 1
+    matrix = sparse.csr_matrix((length/np.diff(edges_new)[row], (row, col)), shape=(len(x_new), len(x)))
+
+    if cache:
+        _cache_set(('rebin', ), (x, x_new), matrix)
+    return matrix
+
+
+def resample(x, y, x_new, kind='linear', axis=-1, fill_value=None, cache=True):
+    """Returns y interpolated onto a new grid.
+
+    All curves of a stack (e.g. thousands of spectra on the same x) are
+    interpolated by a single sparse matrix product.
+
+    Args:
+        x (list or array): increasing 1d array.
+        y (list or array): array. If multidimensional, data is interpolated along ``axis``.
+        x_new (list or array): 1d array (target grid).
+        kind (str, optional): ``'linear'`` or ``'cubic'``. See :py:func:`interp_matrix`.
+        axis (int, optional): axis of y that corresponds to x.
+        fill_value (float, optional): value for points outside x. If ``None``,
+            the closest edge value is used (same as ``np.interp``).
+        cache (bool, optional): if True, interpolation weights are reused for
+            subsequent calls with the same pair of grids.
+
+    Returns:
+        array.
+
+    See Also:
+        :py:func:`interp_matrix`, :py:func:`rebin`
+    """
+    final = _apply_matrix(interp_matrix(x, x_new, kind=kind, cache=cache), y, axis=axis)
+    if fill_value is not None:
+        x = np.asarray(x)
+        x_new = np.asarray(x_new)
+        outside = np.logical_or(x_new < x[0], x_new > x[-1])
+        if np.any(outside):
+            final = np.moveaxis(final, axis, -1)
+            final[..., outside] = fill_value
+            final = np.moveaxis(final, -1, axis)
+    return final
+
+
+def rebin(x, y, x_new, axis=-1, cache=True):
+    """Returns y rebinned onto a new grid, conserving the integral of y.
+
+    Unlike interpolation, rebinning onto a coarser grid averages all points
+    within each new bin. Target bins only partially covered by x are
+    underestimated.
+
+    Args:
+        x (list or array): increasing 1d array with bin centers.
+        y (list or array): array. If multidimensional, data is rebinned along ``axis``.
+        x_new (list or array): increasing 1d array with the new bin centers.
+        axis (int, optional): axis of y that corresponds to x.
+        cache (bool, optional): if True, rebinning weights are reused for
+            subsequent calls with the same pair of grids.
+
+    Returns:
+        array.
+
+    See Also:
+        :py:func:`rebin_matrix`, :py:func:`resample`
+    """
+    return _apply_matrix(rebin_matrix(x, x_new, cache=cache), y, axis=axis)
+
+
+def sort(ref, *args, kind='stable', return_index=False):
+    """Returns sorted arrays based on a reference array.
+
+    The sorting permutation is computed only once and applied to all arrays.
+
+    Example:
+        >>> x, y = manip.sort([3, 1, 2], [3, 1, 2], [30, 10, 20])
+        >>> print(y)
+        [10 20 30]
+
+    Args:
+        ref (list or array): 1d reference array.
+        args (list or array): arrays to be sorted. Multidimensional arrays are
+            sorted along the first axis.
+        kind (str, optional): sorting algorithm (see `np.argsort <https://numpy.org/doc/stable/reference/generated/numpy.argsort.html>`_).
+            ``'stable'`` preserves the order of repeated values in ``ref``.
+        return_index (bool, optional): if True, the permutation array is
+            also returned, so it can be reused (e.g. ``np.take(z, index, axis=0)``).
+
+    Returns:
+        list of sorted arrays (and permutation array if ``return_index=True``).
+    """
+    index = np.argsort(np.asarray(ref), kind=kind)
+    s = [np.take(np.asarray(x), index, axis=0) for x in args]
+    if return_index:
+        return s, index
     return s
 
 
-# def increasing_monotonicity(dataX, dataY):
-#     """Returns an array sorted and monotonic.
-#
-#     The sorting is based on dataX and the monotonicity is done by averaging
-#     dataY for same dataX values.
-#
-#     If you need decreasing monotonicity just run this function and invert the
-#     returned arrays.
-#
-#     :param dataX: list of numbers
-#     :param dataY: list of numbers
-#     :return: two numpy arrays (x_monotonic, y_monotonic)
-#
-#     Example:    dataX= [1, 2, 4, 2, 1]
-#                 dataY = [5, 6, 9, 8, 9]
-#
-#                 x_return = [1, 2, 4]
-#                 y_return = [7, 7, 9]
-#     """
-#     # sort increasingly
-#     data2sort = np.array(np.transpose([dataX, dataY]))
-#     data_sorted = data2sort[data2sort[:, 0].argsort()]
-#
-#     done = False
-#     data_sorted_clean = np.copy(data_sorted)
-#     i = 0
-#
-#     while not done:
-#         val = data_sorted_clean[i, 0]
-#
-# #        print(i, val)
-#         if i == len(data_sorted_clean)-1:
-# #            print('aqui')
-#             done = True
-#             return data_sorted_clean[:, 0], data_sorted_clean[:, 1]
-#
-#         #Find how many duplicates there is
-#         number_of_duplicates = 0
-#         k = np.copy(i)
-#         while val == data_sorted_clean[k+1, 0]:
-#             k = k+1
-#             number_of_duplicates = number_of_duplicates+1
-#             if k==(len(data_sorted_clean)-1):
-#                 done = True
-#                 break
-# #        print(i, val, k, number_of_duplicates)
-#
-#         #Mean
-#         if number_of_duplicates>=1:
-#             data_sorted_clean[i, 1] = np.mean(data_sorted_clean[i:(i+number_of_duplicates+1), 1], dtype=np.float64)
-# #            print(data_sorted_clean)
-#
-#             for j in range(number_of_duplicates):
-# #                print('e')
-#                 data_sorted_clean = np.delete(data_sorted_clean, i+1, axis=0)
-# #                print(data_sorted_clean)
-#         i = i + 1
-#
-#         if done:
-#             return data_sorted_clean[:, 0], data_sorted_clean[:, 1]
+def increasing_monotonicity(x, y, reduction='mean', weights=None, grid=None, return_counts=False):
+    """Returns x sorted and strictly increasing with y values of repeated x reduced.
+
+    Useful for merging data measured on overlapping grids before using
+    ``np.interp``, which requires an increasing x. Data is sorted only once
+    and repeated values are reduced in a single vectorized pass.
+
+    If you need decreasing monotonicity just run this function and invert the
+    returned arrays.
+
+    Example:
+        >>> x, y = manip.increasing_monotonicity([1, 2, 4, 2, 1], [5, 6, 9, 8, 9])
+        >>> print(x, y)
+        [1 2 4] [7. 7. 9.]
+
+    Args:
+        x (list or array): 1d array.
+        y (list or array): 1d array.
+        reduction (str, optional): how y values of repeated x are combined.
+            Use ``'mean'``, ``'median'``, ``'sum'``, or ``'weighted'`` (weighted mean).
+        weights (list or array, optional): weights for ``reduction='weighted'``,
+            e.g., number of counts or ``1/sigma**2``.
+        grid (list or array, optional): increasing 1d array. If not None, data is
+            rebinned onto this grid, i.e., each x is assigned to the closest
+            grid point (points farther than half spacing from the grid edges
+            are disregarded). Grid points without data are set to ``np.nan``
+            (for every reduction, including ``'sum'``).
+        return_counts (bool, optional): if True, the number of points
+            combined in each returned point is also returned.
+
+    Returns:
+        x and y arrays (and counts array if ``return_counts=True``).
+    """
+    if reduction not in ('mean', 'median', 'sum', 'weighted'):
+        raise ValueError("reduction must be 'mean', 'median', 'sum', or 'weighted'.")
+    if reduction == 'weighted' and weights is None:
+        raise ValueError("weights must be given for reduction='weighted'.")
+
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+    if x.shape != y.shape or (weights is not None and weights.shape != x.shape):
+        raise ValueError('x, y, and weights must have the same shape.')
+
+    if grid is None:
+        # sort once (if not sorted yet), then label runs of equal x
+        if not np.all(x[1:] >= x[:-1]):
+            order = np.argsort(x)
+            x, y = x[order], y[order]
+            if weights is not None:
+                weights = weights[order]
+        new_value = np.empty(len(x), dtype=bool)
+        new_value[:1] = True
+        np.not_equal(x[1:], x[:-1], out=new_value[1:])
+        inverse = np.cumsum(new_value) - 1
+        x_final = x[new_value]
+    else:
+        x_final = np.asarray(grid, dtype=float)
+        if len(x_final) > 1:
+            edges = (x_final[1:] + x_final[:-1])/2
+            lower = x_final[0] - (x_final[1] - x_final[0])/2
+            upper = x_final[-1] + (x_final[-1] - x_final[-2])/2
+        else:
+            edges = np.array([])
+            lower = upper = x_final[0]
+        inside = np.logical_and(x >= lower, x <= upper)
+        if not np.all(inside):
+            x, y = x[inside], y[inside]
+            if weights is not None:
+                weights = weights[inside]
+        step = (x_final[-1] - x_final[0])/max(len(x_final) - 1, 1)
+        if len(x_final) > 1 and np.allclose(np.diff(x_final), step, rtol=1e-9, atol=0):
+            # uniform grid: bin index is computed directly
+            inverse = np.clip(np.floor((x - lower)/step).astype(np.intp), 0, len(x_final)-1)
+        else:
+            inverse = np.searchsorted(edges, x)
+    n = len(x_final)
+
+    counts = np.bincount(inverse, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if reduction == 'sum':
+            y_final = np.bincount(inverse, weights=y, minlength=n)
+        elif reduction == 'mean':
+            y_final = np.bincount(inverse, weights=y, minlength=n)/counts
+        elif reduction == 'weighted':
+            y_final = np.bincount(inverse, weights=weights*y, minlength=n)/np.bincount(inverse, weights=weights, minlength=n)
+        else:
+            # y sorted within groups by a single sort of integer keys (group, rank of y)
+            order = np.argsort(y)
+            rank = np.empty(len(y), dtype=np.int64)
+            rank[order] = np.arange(len(y))
+            key = inverse.astype(np.int64)*len(y) + rank
+            key.sort()
+            y_sorted = y[order[key % max(len(y), 1)]]
+            start = np.cumsum(counts) - counts
+            low = np.minimum(start + (counts-1)//2, len(y_sorted)-1)
+            high = np.minimum(start + counts//2, len(y_sorted)-1)
+            y_final = (y_sorted[low] + y_sorted[high])/2 if len(y_sorted) > 0 else np.zeros(n)
+        y_final = y_final.astype(float, copy=False)
+        y_final[counts == 0] = np.nan
+
+    if return_counts:
+        return x_final, y_final, counts
+    return x_final, y_final
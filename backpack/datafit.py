@@ -18,6 +18,7 @@ p_guess
 p_fitted
 p_error
 linked_parameters
+namespace
 id_list
 submodel
 residue
@@ -28,6 +29,7 @@ get_parameters
 update_model
 update_submodels
 fit
+get_properties
 
 functions:
 fake_sigma
@@ -35,11 +37,11 @@ fake_sigma
 
 # standard libraries
 import copy
+import importlib
+import sys
+import warnings
 import numpy as np
 from pathlib import Path
-import inspect
-import sys
-import importlib
 
 # matplotlib
 import matplotlib.pyplot as plt
@@ -49,6 +51,8 @@ import matplotlib.cm as cm
 from .model_functions import *
 from .libremanip2 import sheet
 from .arraymanip import index
+from . import arraymanip as am
+from . import figmanip as figm
 
 # fit
 from scipy.optimize import curve_fit
@@ -68,6 +72,26 @@ der_guess_def = dict(linewidth=2, linestyle='--', color='green')
 sub_def     = dict(linewidth=1)
 
 
+# models of functions defined in __main__ (not added to the global registry)
+_main_models = dict()
+
+
+def _get_model(submodel_name):
+    """Returns the model for a submodel name.
+
+    Functions defined in ``__main__`` take precedence. Their models are
+    created on first use (and again if redefined) and kept in a local
+    namespace, so registered models are not overwritten.
+    """
+    import __main__
+    function = getattr(__main__, submodel_name, None)
+    if callable(function):
+        if submodel_name not in _main_models or _main_models[submodel_name].function is not function:
+            _main_models[submodel_name] = Model(function, name=submodel_name)
+        return _main_models[submodel_name]
+    return get_model(submodel_name)
+
+
 def get_parameters(self,):
     # self = sheet
 
@@ -102,7 +126,6 @@ def get_parameters(self,):
 
 
 def update_model(self):
-    refresh()
 
     var_string = ''
     model_string = ''
@@ -126,6 +149,7 @@ def update_model(self):
     p = 0
     x = 0
     self.linked_parameters = {}
+    self.namespace = {'np': np}
     for submodel in self.parameters:
 
         # check if this submodel should be used
@@ -139,13 +163,14 @@ def update_model(self):
             submodel_name = submodel.split('#')[0]
 
             # get arguments from function
-            args_expected = list(inspect.signature(eval(submodel_name)).parameters)
+            model = _get_model(submodel_name)
+            self.namespace[submodel_name] = model.function
 
             # initialize model
             model_string += f"{submodel_name}(x, "
 
             # build min, max, guess, model
-            for arg in args_expected[1: ]:
+            for arg in model.args:
                 # print(submodel, arg)
 
                 # check if submodel has active argument
@@ -246,7 +271,7 @@ def update_model(self):
     self.id_list = [s.strip() for s in eval('["' + var_string[:-2].replace(',', '","') + '"]')]
 
     self.model_string = f'lambda x, {var_string[:-2]}: {model_string[:-3]}'
-    self.model = eval(self.model_string)
+    self.model = eval(self.model_string, self.namespace)
 
     # check guess, min, max ============================
     if '' in self.p_guess:
@@ -284,18 +309,17 @@ def update_submodels(self):
             submodel_name = submodel.split('#')[0]
 
             # get arguments from function
-            import __main__
-            try:
-                args_expected = list(inspect.signature(eval(f'__main__.{submodel_name}')).parameters)
-            except AttributeError:
-                args_expected = list(inspect.signature(eval(submodel_name)).parameters)
+            model = _get_model(submodel_name)
 
             # initialize submodel
             self.submodel[submodel]['guess_string'] += f'{submodel_name}(x, '
             self.submodel[submodel]['fit_string'] += f'{submodel_name}(x, '
+            self.submodel[submodel]['model'] = model
+            self.submodel[submodel]['args'] = []
+            self.submodel[submodel]['index'] = []
 
 
-            for arg in args_expected[1: ]:
+            for arg in model.args:
 
                 # check if submodel has active argument
                 missing_arg = False
@@ -310,15 +334,20 @@ def update_submodels(self):
                     id = self.parameters[submodel][arg]['id'][to_use]
                     self.submodel[submodel]['guess_string'] += str(self.p_guess[self.id_list.index(id)]) + ', '
                     self.submodel[submodel]['fit_string']   += str(self.p_fitted[self.id_list.index(id)]) + ', '
+                    self.submodel[submodel]['args'].append(self.p_fitted[self.id_list.index(id)])
+                    self.submodel[submodel]['index'].append(self.id_list.index(id))
                 else:
                     self.submodel[submodel]['guess_string'] += str(self.parameters[submodel][arg]['guess'][to_use]) + ', '
                     self.submodel[submodel]['fit_string'] += str(self.parameters[submodel][arg]['fitted'][to_use]) + ', '
+                    self.submodel[submodel]['args'].append(self.parameters[submodel][arg]['fitted'][to_use])
+                    self.submodel[submodel]['index'].append(None)
 
             self.submodel[submodel]['guess_string'] = self.submodel[submodel]['guess_string'][:-2] + ')'
             self.submodel[submodel]['fit_string'] = self.submodel[submodel]['fit_string'][:-2] + ')'
 
-            self.submodel[submodel]['guess'] = eval(f'lambda x:' + self.submodel[submodel]['guess_string'])
-            self.submodel[submodel]['fit'] = eval(f'lambda x:' + self.submodel[submodel]['fit_string'])
+            namespace = {submodel_name: model.function, 'np': np}
+            self.submodel[submodel]['guess'] = eval(f'lambda x:' + self.submodel[submodel]['guess_string'], namespace)
+            self.submodel[submodel]['fit'] = eval(f'lambda x:' + self.submodel[submodel]['fit_string'], namespace)
 
 
 def fit(self, x, y, ties=None, global_sigma=1e-13, save=True):
@@ -352,10 +381,10 @@ def fit(self, x, y, ties=None, global_sigma=1e-13, save=True):
             submodel_name = submodel.split('#')[0]
 
             # get arguments from function
-            args_expected = list(inspect.signature(eval(submodel_name)).parameters)
+            model = _get_model(submodel_name)
 
             # build min, max, guess, model
-            for arg in args_expected[1: ]:
+            for arg in model.args:
 
                 # check if submodel has active argument
                 missing_arg = False
@@ -376,11 +405,31 @@ def fit(self, x, y, ties=None, global_sigma=1e-13, save=True):
                     self.parameters[submodel][arg]['error'][to_use] = v2
 
     self.update_submodels()
+    self.get_properties()
 
     if save:
         self.calc.save()
 
 
+def get_properties(self):
+    """Compute area, FWHM, and centroid of each submodel from the fitted parameters.
+
+    Values are computed from closed-form expressions (see
+    :py:meth:`backpack.model_functions.Model.properties`), so no model
+    evaluation is needed. Uncertainties are propagated from ``p_cov``
+    (parameters that are not fitted have no uncertainty).
+
+    Results are saved in ``self.submodel[submodel]['properties']``.
+    """
+    for submodel in self.submodel:
+        index = self.submodel[submodel]['index']
+        cov = np.zeros((len(index), len(index)))
+        fitted = [i for i, k in enumerate(index) if k is not None]
+        if hasattr(self, 'p_cov') and fitted:
+            cov[np.ix_(fitted, fitted)] = self.p_cov[np.ix_([index[i] for i in fitted], [index[i] for i in fitted])]
+        self.submodel[submodel]['properties'] = self.submodel[submodel]['model'].properties(self.submodel[submodel]['args'], cov=cov)
+
+
 def fake_sigma(x, global_sigma=10**-10, sigma_specific=None):
     """Build a fake sigma array which determines the uncertainty in ydata.
 
@@ -411,7 +460,12 @@ def fake_sigma(x, global_sigma=10**-10, sigma_specific=None):
 
 
 def refresh():
+    """Reload this module.
 
+    Deprecated, it will be removed in a future version. Use
+    ``importlib.reload(backpack.datafit)`` instead.
+    """
+    warnings.warn('refresh() is deprecated. Use importlib.reload(backpack.datafit) instead.', DeprecationWarning)
     importlib.reload(sys.modules[__name__])
 
 
@@ -545,11 +599,7 @@ sheet.get_parameters = get_parameters
 sheet.update_model = update_model
 sheet.update_submodels = update_submodels
 sheet.fit = fit
+sheet.get_properties = get_properties
 sheet.plot_fit = plot_fit
 sheet.plot_guess = plot_guess
 
-
-try:
-    from __main__ import *
-except ImportError:
-    pass
@@ -9,11 +9,63 @@ import numpy as np
 import datetime
 from copy import deepcopy
 import collections
+import collections.abc
+import mmap
+import itertools
+import concurrent.futures
+import fnmatch
+import time
+import threading
+import queue
+import shutil
+import io
+import gzip
 from .intermanip import query_yes_no
 import json
+import hashlib
 # %%
 import warnings
 import re
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+try:
+    import msgpack
+except ModuleNotFoundError:
+    msgpack = None
+
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ModuleNotFoundError:
+    lz4 = None
+
+try:
+    import watchdog.events
+    import watchdog.observers
+except ModuleNotFoundError:
+    watchdog = None
+
+# number of rows parsed at a time by load_data
+load_chunk_size = 100000
+# number of rows formatted at a time by save_data
+save_chunk_size = 100000
+# folder where load_data(..., cache=True) stores parsed data. If None, the
+# cache is saved in a hidden ``.npcache`` folder next to the data file
+# (``.npcache/<filename>``)
+cache_dir = None
+# buffer size (in bytes) of files written by save_text, save_obj, and save_data
+write_buffer_size = 2**20
+# if True, files are flushed to disk (os.fsync) before save_* returns (or
+# before the background write finishes). Safer, but slower
+default_fsync = False
 # %%
 def rename_files(filelist, pattern, newPattern, ask=True):
     """Change the filename pattern of files.
@@ -107,12 +159,299 @@ def rmdir(dirpath):
     dirpath.rmdir()
 
 
+# numbers (int or float) within file names
+_number_pattern = re.compile(r'[\d]+[.,\d]+|[\d]*[.][\d]+|[\d]+')
+# name of the cache folders of load_data (not listed by filelist)
+_cache_name = '.npcache'
+
+
+class DirectoryIndex(object):
+    """Cached list of the files (and folders) in a directory.
+
+    The directory is scanned with ``os.scandir`` only when its modification
+    time changes (a file is created, deleted, or renamed), so repeated calls
+    of :py:func:`filelist` and :py:func:`parsed_filelist` do not rescan large
+    (or network mounted) directories. Filelists (for each pattern) and
+    parsed filelists are also cached until the directory changes.
+
+    Example:
+        >>> index = DirectoryIndex('scans')
+        >>> while True:
+        ...     for filepath in index.refresh():
+        ...         process(filepath)  # only new files
+
+    Args:
+        dirpath (str or pathlib.Path): directory path.
+
+    Attributes:
+        dirpath (pathlib.Path): directory path.
+        names (list): sorted file (and folder) names.
+    """
+
+    def __init__(self, dirpath='.'):
+        self.dirpath = Path(dirpath)
+        self.names = []
+        self._mtime = None
+        self._stable = False
+        self._filelists = dict()
+        self._parsed = dict()
+
+    def __repr__(self):
+        return f"DirectoryIndex('{self.dirpath}', n_files={len(self.names)})"
+
+    def refresh(self):
+        """Updates the index if the directory was modified.
+
+        Returns:
+            sorted list with the paths of new files (since last refresh).
+        """
+        mtime = os.stat(self.dirpath).st_mtime_ns
+        if mtime == self._mtime and self._stable:
+            return []
+
+        # changes within the same mtime tick would be missed, so the
+        # directory is scanned again until its mtime is old enough
+        scan_time = time.time_ns()
+        with os.scandir(self.dirpath) as entries:
+            names = sorted(entry.name for entry in entries if entry.name != _cache_name)
+        new = sorted(set(names).difference(self.names))
+        if names != self.names:
+            self._filelists.clear()
+            self._parsed.clear()
+        self.names = names
+        self._mtime = mtime
+        self._stable = mtime < scan_time - 2*10**9
+        return [self.dirpath/name for name in new]
+
+    def filelist(self, string='*'):
+        """Returns a list with all the files containg `string` in its name (see :py:func:`filelist`)."""
+        return [self.dirpath/name for name in self._filelist(string)]
+
+    def parsed_filelist(self, string='*', ref=0, type='int'):
+        """Returns a filelist organized in a dictionary (see :py:func:`parsed_filelist`)."""
+        parsed = self._parsed_filelist(string, ref, type)
+        return collections.OrderedDict((key, self.dirpath/parsed[key]) for key in parsed)
+
+    def _filelist(self, string):
+        """Returns the (cached) file names matching string."""
+        self.refresh()
+        if string not in self._filelists:
+            pattern = string if '*' in string else '*' + string + '*'
+            self._filelists[string] = fnmatch.filter(self.names, pattern)
+        return self._filelists[string]
+
+    def _parsed_filelist(self, string, ref, type):
+        """Returns the (cached) file names matching string organized in a dictionary."""
+        names = self._filelist(string)
+        key = (string, ref, type)
+        if key not in self._parsed:
+            temp = dict()
+            for name in names:
+                n = _number_pattern.findall(name)
+                if n != []:
+                    if type=='int':
+                        temp[int(float((n[ref])))] = name
+                    else:
+                        temp[float(n[ref])] = name
+            self._parsed[key] = collections.OrderedDict((key, temp[key]) for key in sorted(temp))
+        return self._parsed[key]
+
+
+class DirectoryWatcher(object):
+    """Yields new and modified files in a directory as soon as they are completely written.
+
+    Uses ``watchdog`` (inotify and similar OS notifications) if installed.
+    Otherwise, the directory is polled every ``interval`` seconds. A file is
+    considered completely written when it is closed (if the OS notifies it)
+    or when its size and modification time do not change for ``settle``
+    seconds.
+
+    Example:
+        >>> with DirectoryWatcher('scans', '.dat') as watcher:
+        ...     for filepath in watcher:
+        ...         data = load_data(filepath)
+
+        or, with a callback,
+
+        >>> DirectoryWatcher('scans', '.dat').run(lambda filepath: print(filepath))
+
+    Args:
+        dirpath (str or pathlib.Path, optional): directory path.
+        string (str, optional): string to look for in file names (same as :py:func:`filelist`).
+        settle (number, optional): time (in seconds) that a file must remain
+            unchanged to be considered completely written.
+        interval (number, optional): polling interval (in seconds). With
+            watchdog, this is the interval used to check files that are
+            settling.
+        existing (bool, optional): if True, files that already exist are
+            also yielded.
+        method (str, optional): ``'watchdog'``, ``'polling'``, or None
+            (watchdog if installed).
+    """
+
+    def __init__(self, dirpath='.', string='*', settle=1, interval=0.5, existing=False, method=None):
+        self.dirpath = Path(dirpath)
+        self.pattern = string if '*' in string else '*' + string + '*'
+        self.settle = settle
+        self.interval = interval
+        self.existing = existing
+        if method is None:
+            method = 'polling' if watchdog is None else 'watchdog'
+        elif method not in ('watchdog', 'polling'):
+            raise ValueError("method must be 'watchdog', 'polling', or None.")
+        if method == 'watchdog' and watchdog is None:
+            raise ModuleNotFoundError('watchdog is not installed. Use method=\'polling\'.')
+        self.method = method
+
+        self._stop = threading.Event()
+        self._events = queue.Queue()
+        self._snapshot = dict()
+        self._pending = dict()
+        self._observer = None
+
+    def __repr__(self):
+        return f"DirectoryWatcher('{self.dirpath}', '{self.pattern}', method='{self.method}')"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __iter__(self):
+        self._stop.clear()
+        self._start()
+        try:
+            while not self._stop.is_set():
+                for filepath, closed in self._changes():
+                    self._pending[filepath] = (None, time.monotonic(), closed)
+                yield from self._ready()
+        finally:
+            self._close()
+
+    def run(self, callback, timeout=None):
+        """Calls ``callback(filepath)`` for each new or modified file.
+
+        Args:
+            callback (function): function to be called.
+            timeout (number, optional): stop watching after timeout seconds.
+                If None, it runs until :py:meth:`stop` is called (e.g. from
+                another thread or from the callback).
+        """
+        if timeout is not None:
+            timer = threading.Timer(timeout, self.stop)
+            timer.daemon = True
+            timer.start()
+        for filepath in self:
+            callback(filepath)
+
+    def stop(self):
+        """Stop watching."""
+        self._stop.set()
+
+    def _signatures(self):
+        """Returns the modification time and size of files matching the pattern."""
+        signatures = dict()
+        with os.scandir(self.dirpath) as entries:
+            for entry in entries:
+                if fnmatch.fnmatch(entry.name, self.pattern) and entry.is_file():
+                    stat = entry.stat()
+                    signatures[self.dirpath/entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def _start(self):
+        self._snapshot = self._signatures()
+        if self.existing:
+            for filepath in self._snapshot:
+                self._pending[filepath] = (None, time.monotonic(), False)
+
+        if self.method == 'watchdog':
+            watcher = self
+
+            class Handler(watchdog.events.FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if event.is_directory or event.event_type not in ('created', 'modified', 'moved', 'closed'):
+                        return
+                    filepath = Path(getattr(event, 'dest_path', '') or event.src_path)
+                    if fnmatch.fnmatch(filepath.name, watcher.pattern):
+                        watcher._events.put((watcher.dirpath/filepath.name, event.event_type == 'closed'))
+
+            self._observer = watchdog.observers.Observer()
+            self._observer.schedule(Handler(), str(self.dirpath), recursive=False)
+            self._observer.start()
+
+    def _close(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def _changes(self):
+        """Returns (filepath, closed) of files that changed (waits up to ``interval``)."""
+        if self.method == 'watchdog':
+            changes = []
+            try:
+                changes.append(self._events.get(timeout=self.interval))
+                while True:
+                    changes.append(self._events.get_nowait())
+            except queue.Empty:
+                return changes
+
+        self._stop.wait(self.interval)
+        snapshot = self._signatures()
+        changes = [(filepath, False) for filepath in snapshot if snapshot[filepath] != self._snapshot.get(filepath)]
+        self._snapshot = snapshot
+        return changes
+
+    def _ready(self):
+        """Yields pending files that are closed or did not change for ``settle`` seconds."""
+        now = time.monotonic()
+        for filepath, (signature, changed, closed) in list(self._pending.items()):
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                del self._pending[filepath]
+                continue
+            if closed or (signature == (stat.st_mtime_ns, stat.st_size) and now - changed >= self.settle):
+                del self._pending[filepath]
+                yield filepath
+            elif signature != (stat.st_mtime_ns, stat.st_size):
+                self._pending[filepath] = ((stat.st_mtime_ns, stat.st_size), now, False)
+
+
+_indexes = dict()
+
+
+def _is_recursive(string):
+    """Returns True if glob pattern matches files in subfolders."""
+    return '/' in string or os.sep in string or '**' in string
+
+
+def _get_index(dirpath):
+    """Returns the DirectoryIndex of dirpath (created on first call).
+
+    Indexes are shared by different spellings of the same directory, thus
+    paths must be built from the caller's dirpath and the indexed file names.
+    """
+    key = os.path.abspath(dirpath)
+    if key not in _indexes:
+        _indexes[key] = DirectoryIndex(dirpath)
+    return _indexes[key]
+
+
 def filelist(dirpath='.', string='*'):
     """Returns a list with all the files containg `string` in its name.
 
     Note:
         List is sorted by the filename.
 
+    Note:
+        Directory content is cached and it is only scanned again if the
+        directory is modified (see :py:class:`DirectoryIndex`).
+
+    Note:
+        Cache folders of :py:func:`load_data` (``.npcache``) are not listed.
+
     Args:
         dirpath (str or pathlib.Path, optional): list with full file directory
         paths.
@@ -126,10 +465,17 @@ def filelist(dirpath='.', string='*'):
     """
     dirpath = Path(dirpath)
 
+    # patterns within the directory use the (cached) directory index
+    if not _is_recursive(string):
+        try:
+            return [dirpath/name for name in _get_index(dirpath)._filelist(string)]
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
     if '*' not in string:
         string = '*' + string + '*'
 
-    temp = list(dirpath.glob(string))
+    temp = [filepath for filepath in dirpath.glob(string) if _cache_name not in filepath.relative_to(dirpath).parts]
 
     temp2 = [filepath.name for filepath in temp]
 
@@ -158,17 +504,21 @@ def parsed_filelist(dirpath='.', string='*', ref=0, type='int'):
     """
     dirpath = Path(dirpath)
 
+    # patterns within the directory use the (cached) directory index
+    if not _is_recursive(string):
+        try:
+            parsed = _get_index(dirpath)._parsed_filelist(string, ref, type)
+        except (FileNotFoundError, NotADirectoryError):
+            return collections.OrderedDict()
+        return collections.OrderedDict((key, dirpath/parsed[key]) for key in parsed)
+
     file_list = filelist(dirpath=dirpath, string=string)
 
     temp = dict()
 
-    p = '[\d]+[.,\d]+|[\d]*[.][\d]+|[\d]+'
-
     for filepath in file_list:
-        if re.search(p, filepath.name) is not None:
-            n = []
-            for catch in re.finditer(p, filepath.name):
-                n.append(catch[0])
+        n = _number_pattern.findall(filepath.name)
+        if n != []:
             if type=='int':
                 temp[int(float((n[ref])))] = filepath
             else:
@@ -186,18 +536,33 @@ def parsed_filelist(dirpath='.', string='*', ref=0, type='int'):
     return parsed_folder
 
 
-def save_text(string, filePath='./Untitled.txt', checkOverwrite=False):
+def save_text(string, filePath='./Untitled.txt', checkOverwrite=False, fsync=None, background=False, codec=None, level=None):
     """Save text to txt file.
 
+    Text is written to a temporary file, which replaces filePath only when
+    writing is finished.
+
     Args:
         string (str): string to be saved.
         filePath (str or pathlib.Path, optional): path to save file. If no path
             is given, current working directory is used.
         checkOverwrite (bool, optional): if True, it will check if file exists
             and ask if user want to overwrite file.
+        fsync (bool, optional): if True, file is flushed to disk before
+            returning. If None, ``default_fsync`` is used.
+        background (bool, optional): if True, file is written by a background
+            thread and the function returns immediately.
+        codec (str, optional): compression codec (``'gzip'``, ``'zstd'``, or
+            ``'lz4'``). If None, codec is chosen by file extension (``.gz``,
+            ``.zst``, or ``.lz4``), otherwise, text is not compressed.
+        level (int, optional): compression level. If None, a default level
+            is used (6 for gzip, 3 for zstd, and 0 for lz4).
+
+    Returns:
+        None, or a concurrent.futures.Future if ``background=True``.
 
     See Also:
-        :py:func:`load_text`
+        :py:func:`load_text`, :py:func:`wait_writes`
     """
     filePath = Path(filePath)
 
@@ -213,14 +578,21 @@ def save_text(string, filePath='./Untitled.txt', checkOverwrite=False):
                 warnings.warn('filePath is pointing to a folder. Saving file as Untitled.txt')
                 filePath = filePath/'Untitled.txt'
 
-    f = open(str(filePath), 'w')
-    f.write(string)
-    f.close()
+    if codec is None:
+        codec = _codec_suffixes.get(filePath.suffix.lower())
+    _check_codec(codec)
+
+    def write():
+        with _Writer(filePath, 'w', fsync=fsync, codec=codec, level=level) as file:
+            file.write(string)
+    return _write(write, background)
 
 
 def load_text(filePath):
     """Load text from txt file.
 
+    Compressed files (gzip, zstd, or lz4) are decompressed automatically.
+
     Args:
         filePath (str or pathlib.Path): filepath to load.
 
@@ -230,23 +602,253 @@ def load_text(filePath):
     See Also:
         :py:func:`save_text`
     """
-    f = Path(filePath).open()
+    f = _open_read(filePath)
     text = f.read()
     f.close()
     return text
 
 
-def save_obj(obj, filepath='./Untitled.txt', checkOverwrite=False, prettyPrint=True):
+_codec_suffixes = {'.gz': 'gzip', '.zst': 'zstd', '.lz4': 'lz4'}
+_codec_magic = {b'\x1f\x8b': 'gzip', b'\x28\xb5\x2f\xfd': 'zstd', b'\x04\x22\x4d\x18': 'lz4'}
+
+
+def _check_codec(codec):
+    """Raises an error if codec is not valid or if its module is not installed."""
+    if codec not in (None, 'gzip', 'zstd', 'lz4'):
+        raise ValueError("codec must be 'gzip', 'zstd', 'lz4', or None.")
+    if codec == 'zstd' and zstandard is None:
+        raise ModuleNotFoundError('zstandard is not installed.')
+    if codec == 'lz4' and lz4 is None:
+        raise ModuleNotFoundError('lz4 is not installed.')
+    return codec
+
+
+def _detect_codec(filepath):
+    """Returns the compression codec of a file (by extension or by the first bytes of the file) or None."""
+    suffix = Path(filepath).suffix.lower()
+    if suffix in _codec_suffixes:
+        return _check_codec(_codec_suffixes[suffix])
+    with open(str(filepath), 'rb') as file:
+        start = file.read(4)
+    for magic in _codec_magic:
+        if start.startswith(magic):
+            return _check_codec(_codec_magic[magic])
+    return None
+
+
+def _open_read(filepath, mode='r', **kwargs):
+    """Opens a file for reading. Compressed files (gzip, zstd, lz4) are decompressed on the fly.
+
+    Args:
+        filepath (str or pathlib.Path): path to file.
+        mode (str, optional): ``'r'`` (text) or ``'rb'`` (binary).
+        **kwargs: kwargs are passed to ``open()`` (or ``io.TextIOWrapper``
+            for compressed files).
+
+    Returns:
+        file object. zstd files are not seekable.
+    """
+    codec = _detect_codec(filepath)
+    if codec is None:
+        return open(str(filepath), mode, **kwargs)
+    if codec == 'gzip':
+        stream = gzip.open(str(filepath), 'rb')
+    elif codec == 'zstd':
+        stream = zstandard.ZstdDecompressor().stream_reader(open(str(filepath), 'rb'), read_across_frames=True)
+    else:
+        stream = lz4.frame.open(str(filepath), 'rb')
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, **kwargs)
+
+
+def _compressor(file, codec, level, filename):
+    """Returns a binary file object that compresses data and writes it to file (file is not closed by it)."""
+    if codec == 'gzip':
+        return gzip.GzipFile(filename=filename, mode='wb', compresslevel=6 if level is None else level, fileobj=file)
+    elif codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(file, closefd=False)
+    return lz4.frame.LZ4FrameFile(file, mode='wb', compression_level=0 if level is None else level)
+
+
+class _Writer(object):
+    """Context manager that opens a file for writing (used by save_text, save_obj, and save_data).
+
+    Data is written to a temporary file in the same folder, which replaces
+    filepath only when writing is finished. If an error happens while writing,
+    filepath is left unchanged. If filepath is a symlink, the file it points
+    to is replaced (the symlink is kept), and permissions of an existing file
+    are preserved. In append mode, data is written directly to filepath (compressed data is appended as a new gzip member or zstd/lz4
+    frame).
+
+    Args:
+        filepath (str or pathlib.Path): path to save file.
+        mode (str, optional): ``'w'`` (text) or ``'wb'`` (binary).
+        append (bool, optional): if True, data is appended to filepath.
+        fsync (bool, optional): if True, data is flushed to disk before
+            closing. If None, ``default_fsync`` is used.
+        codec (str, optional): compression codec (``'gzip'``, ``'zstd'``, or
+            ``'lz4'``). If None, data is not compressed.
+        level (int, optional): compression level. If None, a default level
+            is used (6 for gzip, 3 for zstd, and 0 for lz4).
+        **kwargs: kwargs are passed to ``io.TextIOWrapper`` (text mode).
+    """
+
+    def __init__(self, filepath, mode='w', append=False, fsync=None, codec=None, level=None, **kwargs):
+        self.filepath = Path(filepath)
+        self.append = append
+        self.fsync = default_fsync if fsync is None else fsync
+        self.target = Path(os.path.realpath(self.filepath))
+        if append:
+            self.temp = self.filepath
+        else:
+            self.temp = self.target.with_name(f'.{self.target.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        self.raw = open(str(self.temp), 'ab' if append else 'wb', buffering=write_buffer_size)
+        self.stream = self.raw if _check_codec(codec) is None else _compressor(self.raw, codec, level, self.filepath.name)
+        self.file = self.stream if 'b' in mode else io.TextIOWrapper(self.stream, **kwargs)
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if self.file is not self.stream:
+                self.file.flush()
+                self.file.detach()
+            if self.stream is not self.raw:
+                self.stream.close()
+            if exc_type is None and self.fsync:
+                self.raw.flush()
+                os.fsync(self.raw.fileno())
+        finally:
+            self.raw.close()
+        if self.append:
+            return
+        if exc_type is not None:
+            self.temp.unlink()
+            return
+        if self.target.exists():
+            shutil.copymode(self.target, self.temp)
+        os.replace(self.temp, self.target)
+        if self.fsync and hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(str(self.target.parent), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+_writer_executor = None
+_writer_lock = threading.Lock()
+
+
+def _write(function, background):
+    """Runs function now, or in the writer thread if background is True.
+
+    Background writes run one at a time in submission order.
+
+    Returns:
+        None, or a concurrent.futures.Future if background is True.
+    """
+    global _writer_executor
+    if not background:
+        function()
+        return None
+    with _writer_lock:
+        if _writer_executor is None:
+            _writer_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='backpack-writer')
+        return _writer_executor.submit(function)
+
+
+def wait_writes():
+    """Wait until all background writes (``save_*(..., background=True)``) are finished.
+
+    Errors raised in background writes are re-raised by the Future returned
+    by the save function, not here.
+    """
+    with _writer_lock:
+        executor = _writer_executor
+    if executor is not None:
+        executor.submit(lambda: None).result()
+
+
+def _json_default(obj):
+    """Converts numpy arrays and numbers (and other iterables) to python objects for json."""
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    if isinstance(obj, Path):
+        return str(obj)
+    try:
+        return list(obj)
+    except TypeError:
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable') from None
+
+
+def _npz_split(obj, arrays):
+    """Returns obj where numpy arrays are replaced by placeholders (arrays are stored in the arrays dict)."""
+    if isinstance(obj, np.ndarray):
+        key = f'arr_{len(arrays)}'
+        arrays[key] = obj
+        return {'__npz__': key}
+    if isinstance(obj, dict):
+        return {key: _npz_split(obj[key], arrays) for key in obj}
+    if isinstance(obj, (list, tuple)):
+        return [_npz_split(item, arrays) for item in obj]
+    return obj
+
+
+def _npz_join(obj, arrays):
+    """Inverse of :py:func:`_npz_split`."""
+    if isinstance(obj, dict):
+        if list(obj) == ['__npz__']:
+            return arrays[obj['__npz__']]
+        return {key: _npz_join(obj[key], arrays) for key in obj}
+    if isinstance(obj, list):
+        return [_npz_join(item, arrays) for item in obj]
+    return obj
+
+
+def _serializer(filepath, serializer):
+    """Returns the serializer name based on the file extension."""
+    if serializer is None:
+        serializer = {'.npz': 'npz', '.msgpack': 'msgpack', '.mpk': 'msgpack'}.get(Path(filepath).suffix.lower(), 'json')
+    if serializer not in ('json', 'msgpack', 'npz'):
+        raise ValueError("serializer must be 'json', 'msgpack', 'npz', or None.")
+    if serializer == 'msgpack' and msgpack is None:
+        raise ModuleNotFoundError('msgpack is not installed.')
+    return serializer
+
+
+def save_obj(obj, filepath='./Untitled.txt', checkOverwrite=False, prettyPrint=True, serializer=None, fsync=None, background=False):
     """Save object (array, dictionary, list, etc...) to a txt file.
 
+    Numpy arrays and numbers are supported. Data is written to a temporary
+    file, which replaces filepath only when writing is finished.
+
     Args:
         obj (object): object to be saved.
         filepath (str or pathlib.Path, optional): path to save file.
         checkOverwrite (bool, optional): if True, it will check if file exists
             and ask if user want to overwrite file.
+        prettyPrint (bool, optional): if True, json files are indented (4
+            spaces). If False, json is written without whitespace (faster,
+            uses orjson if installed).
+        serializer (str, optional): file format. ``'json'`` (text file), ``'msgpack'`` (binary, requires msgpack), or
+            ``'npz'`` (numpy arrays are saved in binary format, best for
+            objects with large arrays). If None, the format is chosen by
+            file extension (``.npz``, ``.msgpack``, or json for other
+            extensions).
+        fsync (bool, optional): if True, file is flushed to disk before
+            returning. If None, ``default_fsync`` is used.
+        background (bool, optional): if True, file is written by a background
+            thread and the function returns immediately. obj must not be
+            modified until writing is finished.
+
+    Returns:
+        None, or a concurrent.futures.Future if ``background=True``.
 
     See Also:
-        :py:func:`load_obj`
+        :py:func:`load_obj`, :py:func:`wait_writes`
     """
     filepath = Path(filepath)
 
@@ -262,28 +864,56 @@ def save_obj(obj, filepath='./Untitled.txt', checkOverwrite=False, prettyPrint=T
                 warnings.warn('filepath is pointing to a folder. Saving file as Untitled.txt')
                 filepath = filepath/'Untitled.txt'
 
-    with open(str(filepath), 'w') as file:
-        if prettyPrint:
-            file.write(json.dumps(obj, indent=4, sort_keys=False))
+    serializer = _serializer(filepath, serializer)
+    def write():
+        if serializer == 'npz':
+            arrays = dict()
+            structure = json.dumps(_npz_split(obj, arrays), default=_json_default)
+            with _Writer(filepath, 'wb', fsync=fsync) as file:
+                np.savez(file, __structure__=np.array(structure), **arrays)
+        elif serializer == 'msgpack':
+            with _Writer(filepath, 'wb', fsync=fsync) as file:
+                msgpack.pack(obj, file, default=_json_default)
         else:
-            file.write(json.dumps(obj))
+            data = _orjson_dumps(obj) if orjson is not None and not prettyPrint else None
+            if data is not None and b'null' not in data:
+                with _Writer(filepath, 'wb', fsync=fsync) as file:
+                    file.write(data)
+                return
+            separators = None if prettyPrint else (',', ':')  # same output of orjson
+            with _Writer(filepath, 'w', fsync=fsync) as file:
+                json.dump(obj, file, indent=4 if prettyPrint else None, separators=separators, sort_keys=False, default=_json_default)
+    return _write(write, background)
+
+
+def _orjson_dumps(obj):
+    """Returns obj serialized by orjson.
+
+    Numpy objects go through :py:func:`_json_default` so numbers are written
+    the same way as stdlib json. orjson writes nan and inf as null (stdlib json
+    writes NaN and Infinity), thus :py:func:`save_obj` falls back to stdlib
+    json if null is found in the output.
+    """
+    return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
 
 
 def _to_int(obj):
-    """Change keys of a dictionary from string to int when possible."""
-    for key in list(obj.keys()):
-        try:
-            if float(key).is_integer():
-                new_key = int(float(key))
-        except:
-            new_key = key
-        if new_key != key:
-            obj[new_key] = obj[key]
-            del obj[key]
+    """Change keys of dictionaries (also nested ones) from string to int when possible."""
+    if isinstance(obj, dict):
+        final = dict()
+        for key in obj:
+            try:
+                new_key = int(float(key)) if float(key).is_integer() else key
+            except (ValueError, TypeError):
+                new_key = key
+            final[new_key] = _to_int(obj[key])
+        return final
+    if isinstance(obj, list):
+        return [_to_int(item) for item in obj]
     return obj
 
 
-def load_obj(filepath, dict_keys_to_int=False):
+def load_obj(filepath, dict_keys_to_int=False, serializer=None):
     """Load object (array, dictionary, list, etc...) from a txt file.
 
     Args:
@@ -291,6 +921,8 @@ def load_obj(filepath, dict_keys_to_int=False):
         dict_keys_to_int (bool, optional): If True, it will change ALL
             numeric dict keys (even for key in nested dictionarys to int, e.g.,
             dictObject["0.0"] will turn into dictObject[0].
+        serializer (str, optional): file format (see :py:func:`save_obj`).
+            If None, the format is chosen by file extension.
 
     Returns:
         object.
@@ -300,21 +932,144 @@ def load_obj(filepath, dict_keys_to_int=False):
     """
     filepath = Path(filepath)
 
-
-
-    with open(str(filepath), 'r') as file:
-        if dict_keys_to_int:
-            obj = json.load(file, object_hook=_to_int)
-        else:
+    serializer = _serializer(filepath, serializer)
+    if serializer == 'npz':
+        with np.load(str(filepath)) as arrays:
+            obj = _npz_join(json.loads(str(arrays['__structure__'])), arrays)
+    elif serializer == 'msgpack':
+        with open(str(filepath), 'rb') as file:
+            obj = msgpack.unpack(file, strict_map_key=False)
+    elif orjson is not None:
+        with open(str(filepath), 'rb') as file:
+            data = file.read()
+        try:
+            obj = orjson.loads(data)
+        except orjson.JSONDecodeError:  # NaN and Infinity are not supported by orjson
+            obj = json.loads(data)
+    else:
+        with open(str(filepath), 'r') as file:
             obj = json.load(file)
+
+    if dict_keys_to_int:
+        obj = _to_int(obj)
     return obj
 
 
-def save_data(obj, filepath='./untitled.txt', col_labels=True, data_format='% .10e', header='', footer='', delimiter=',', commentFlag='# ', newline='\n', checkOverwrite=False):
+def _format_e(values, flag, precision):
+    """Returns values formatted as ``%{flag}.{precision}e`` (vectorized).
+
+    Output is the same as python formatting. Returns an uint8 array with shape
+    (number of characters, len(values)), where zeros are used as padding.
+    """
+    values = np.asarray(values, dtype=float)
+    absolute = np.abs(values)
+    regular = (absolute > 1e-290) & (absolute < 1e290)  # also excludes 0, nan, inf
+    absolute[~regular] = 1
+    exponent = np.floor(np.log10(absolute)).astype(np.int64)
+    scaled = absolute*np.power(10.0, precision - exponent)
+    # log10 may be off by one near powers of 10
+    exponent[scaled >= 10.0**(precision+1)] += 1
+    exponent[scaled < 10.0**precision] -= 1
+    scaled = absolute*np.power(10.0, precision - exponent)
+    digits = np.rint(scaled).astype(np.int64)
+    carry = digits >= 10**(precision+1)
+    digits[carry] //= 10
+    exponent[carry] += 1
+
+    # sign, digit, point, decimals, e, exponent sign, exponent (2 or 3 digits)
+    e = np.abs(exponent).astype(np.uint32)
+    long_exponent = np.any(e >= 100)
+    chars = np.empty((precision + 7 + long_exponent, len(values)), dtype=np.uint8)
+    chars[0] = ord(flag) if flag else 0
+    chars[0, np.signbit(values)] = ord('-')
+    chars[2] = ord('.') if precision > 0 else 0
+    chars[3+precision] = ord('e')
+    chars[4+precision] = ord('+')
+    chars[4+precision, exponent < 0] = ord('-')
+
+    # decimal digits (integer divisions in uint32 are faster)
+    rows = [1] + list(range(3, 3 + precision))
+    split = (precision + 1)//2
+    high, low = np.divmod(digits, 10**split)
+    for number, digit_rows in ((low.astype(np.uint32), rows[len(rows)-split:]), (high.astype(np.uint32), rows[:len(rows)-split])):
+        for row in reversed(digit_rows):
+            quotient = number//10
+            np.add(number - quotient*10, ord('0'), out=chars[row], casting='unsafe')
+            number = quotient
+    for row in range(len(chars) - 1, 4 + precision, -1):
+        quotient = e//10
+        np.add(e - quotient*10, ord('0'), out=chars[row], casting='unsafe')
+        e = quotient
+    if long_exponent:
+        chars[5+precision, chars[5+precision] == ord('0')] = 0
+
+    # special values and values close to rounding ties are formatted by python
+    tolerance = 10.0**(precision + 1)*1e-15
+    fmt = f'%{flag}.{precision}e'
+    texts = {i: (fmt % values[i]).encode() for i in np.flatnonzero(~regular | (np.abs(scaled - np.floor(scaled) - 0.5) < tolerance))}
+    width = max([len(text) for text in texts.values()], default=0)
+    if width > len(chars):  # e.g. 3 digit exponents of values out of the regular range
+        chars = np.concatenate((chars, np.zeros((width - len(chars), len(values)), dtype=np.uint8)))
+    for i, text in texts.items():
+        chars[:, i] = 0
+        chars[:len(text), i] = np.frombuffer(text, dtype=np.uint8)
+    return chars
+
+
+def _format_rows(data, formats, delimiter, newline):
+    """Returns a 2d array formatted as text.
+
+    Columns with format ``'%.Ne'``, ``'% .Ne'``, or ``'%+.Ne'`` (N <= 12) are
+    formatted by :py:func:`_format_e`. Other formats are formatted by python
+    (a single string formatting operation per block of rows).
+    """
+    if isinstance(formats, str):
+        return (formats + newline)*len(data) % tuple(data.ravel().tolist())
+
+    matches = [re.fullmatch(r'%([ +]?)\.(\d+)e', fmt) for fmt in formats]
+    if data.dtype.kind not in 'fiu' or not all(matches) or max(int(match[2]) for match in matches) > 12:
+        return (delimiter.join(formats) + newline)*len(data) % tuple(data.ravel().tolist())
+
+    parts = []
+    for i, match in enumerate(matches):
+        if i > 0:
+            parts.append(np.broadcast_to(np.frombuffer(delimiter.encode(), dtype=np.uint8)[:, None], (len(delimiter.encode()), len(data))))
+        parts.append(_format_e(data[:, i], match[1], int(match[2])))
+    parts.append(np.broadcast_to(np.frombuffer(newline.encode(), dtype=np.uint8)[:, None], (len(newline.encode()), len(data))))
+    chars = np.concatenate(parts).T.ravel()
+    if not np.all(chars):
+        chars = chars[chars != 0]
+    return chars.tobytes().decode()
+
+
+def _data_blocks(obj, labels):
+    """Yields 2d arrays with at most ``save_chunk_size`` rows from obj (dict, array, list, or iterator of those)."""
+    if isinstance(obj, dict):
+        columns = [obj[key] for key in labels]
+        for start in range(0, max([len(column) for column in columns], default=0), save_chunk_size):
+            yield np.column_stack([np.asarray(column[start:start+save_chunk_size]) for column in columns])
+    elif isinstance(obj, (list, tuple, np.ndarray)):
+        obj = np.asarray(obj)
+        if obj.ndim == 1:
+            obj = obj[:, None]
+        for start in range(0, len(obj), save_chunk_size):
+            yield obj[start:start+save_chunk_size]
+    else:
+        for chunk in obj:
+            yield from _data_blocks(chunk, labels)
+
+
+def save_data(obj, filepath='./untitled.txt', col_labels=True, data_format='% .10e', header='', footer='', delimiter=',', commentFlag='# ', newline='\n', checkOverwrite=False, append=False, fsync=None, background=False, codec=None, level=None):
     r"""Save an array or a dictionary in a txt file.
 
     If obj is a dictionary, ``col_labels`` are the keys of the dictionary.
 
+    Data is written in blocks of ``save_chunk_size`` rows, so obj can also be
+    an iterator (e.g. a generator) that yields arrays or dictionaries (data
+    does not need to be in memory all at once). Scientific notation formats
+    (e.g. ``'% .10e'``) are formatted by a vectorized routine, which gives the
+    same output of ``np.savetxt``, but much faster.
+
     Note:
         Use ``*`` in front of a dict key to do not save it to the file.
 
@@ -322,7 +1077,9 @@ def save_data(obj, filepath='./untitled.txt', col_labels=True, data_format='% .1
         This function has not been fully tested.
 
     Args:
-        obj (dict, list, or numpy.array): data to be saved to a file.
+        obj (dict, list, numpy.array, or iterator): data to be saved to a file.
+            Iterators must yield dicts (with the same keys) or arrays (with
+            the same number of columns).
         filepath (str or pathlib.Path, optional): path to save file.
         col_labels (bool, optional): When obj is a dictonary, ``col_labels=true``
             makes the dict keys to be added to the header as column labels.
@@ -358,13 +1115,29 @@ def save_data(obj, filepath='./untitled.txt', col_labels=True, data_format='% .1
         newline (str, optional): string to indicate new lines.
         checkOverwrite (bool, optional): if True, it will check if file exists
             and ask if user want to overwrite file.
+        append (bool, optional): if True, data is appended to the end of the
+            file (useful for saving data in chunks, e.g., during an
+            acquisition). Header is written only if file does not exist or is empty.
+        fsync (bool, optional): if True, file is flushed to disk before
+            returning. If None, ``default_fsync`` is used.
+        background (bool, optional): if True, file is written by a background
+            thread and the function returns immediately. obj must not be
+            modified until writing is finished.
+        codec (str, optional): compression codec (``'gzip'``, ``'zstd'``, or
+            ``'lz4'``). If None, codec is chosen by file extension (``.gz``,
+            ``.zst``, or ``.lz4``), otherwise, data is not compressed.
+        level (int, optional): compression level. If None, a default level
+            is used (6 for gzip, 3 for zstd, and 0 for lz4).
+
+    Returns:
+        None, or a concurrent.futures.Future if ``background=True``.
 
     See Also:
-        :py:func:`load_data`
+        :py:func:`load_data`, :py:func:`wait_writes`
     """
     filepath = Path(filepath)
 
-    if checkOverwrite:
+    if checkOverwrite and not append:
         if filepath.exists() == True:
             if filepath.is_file() == True:
                 if query_yes_no('File already exists!! Do you wish to ovewrite it?', 'yes') == True:
@@ -376,29 +1149,63 @@ def save_data(obj, filepath='./untitled.txt', col_labels=True, data_format='% .1
                 warnings.warn('filepath is pointing to a folder. Saving file as Untitled.txt')
                 filepath = filepath/'Untitled.txt'
 
-    if type(obj) == dict:
+    # first chunk of iterators (dict keys and number of columns)
+    if not isinstance(obj, (dict, list, tuple, np.ndarray)):
+        obj = iter(obj)
+        try:
+            first = next(obj)
+        except StopIteration:
+            first = []
+        obj = itertools.chain([first], obj)
+    else:
+        first = obj
+
+    labels = None
+    if isinstance(first, dict):
         # remove keys that start with star (*)
-        obj2 = {key: obj[key] for key in obj if str(key).startswith('*') is False}
+        labels = [key for key in first if str(key).startswith('*') is False]
 
         # col labels
         if col_labels:
-            for key in obj2:
+            for key in labels:
                 header += str(key) + f'{delimiter}'
             header = header[:-(len(delimiter))]
 
-        # dict to array
-        obj = []
-        for key in obj2:
-            obj.append(obj2[key])
-        obj = np.array(obj).transpose()
-
-    np.savetxt(filepath, obj, fmt=data_format, delimiter=delimiter, newline=newline, header=header, footer=footer, comments=commentFlag)
+        if isinstance(data_format, dict):
+            data_format = [data_format[key] for key in labels]
+
+    # formats
+    formats = data_format
+    if isinstance(data_format, str) and data_format.count('%') == 1:
+        n_cols = len(labels) if labels is not None else (1 if np.ndim(first) < 2 else np.shape(first)[1])
+        formats = [data_format]*n_cols
+
+    if codec is None:
+        codec = _codec_suffixes.get(filepath.suffix.lower())
+    _check_codec(codec)
+
+    def write():
+        _header = header
+        if append and filepath.exists() and filepath.stat().st_size > 0:
+            _header = ''
+        with _Writer(filepath, 'w', append=append, fsync=fsync, codec=codec, level=level, newline='') as file:
+            if _header != '':
+                file.write(commentFlag + _header.replace('\n', '\n' + commentFlag) + newline)
+            for block in _data_blocks(obj, labels):
+                if np.iscomplexobj(block):
+                    np.savetxt(file, block, fmt=data_format, delimiter=delimiter, newline=newline)
+                else:
+                    file.write(_format_rows(block, formats, delimiter, newline))
+            if footer != '':
+                file.write(commentFlag + footer.replace('\n', '\n' + commentFlag) + newline)
+    return _write(write, background)
 
 
 def load_Comments(filepath, commentFlag='#', stopFlag='#'):
     """Return comments from text files.
 
     Comments must be indicated at the begining of the line by the comment flag.
+    Compressed files (gzip, zstd, or lz4) are decompressed automatically.
 
     Args:
         filepath (str or pathlib.Path): fullpath to file
@@ -418,12 +1225,12 @@ def load_Comments(filepath, commentFlag='#', stopFlag='#'):
     l = len(commentFlag)
 
     if stopFlag is None:
-        with open(filepath) as file:
+        with _open_read(filepath) as file:
             for line in file:
                 if line[0:l] == commentFlag:
                     comments.append(line[:])
     elif stopFlag == commentFlag:
-        with open(filepath) as file:
+        with _open_read(filepath) as file:
             comment_started = 0
             for line in file:
                 if line[0:l] == commentFlag and comment_started == 0:
@@ -434,7 +1241,7 @@ def load_Comments(filepath, commentFlag='#', stopFlag='#'):
                 elif line[0:l] != commentFlag and comment_started == 1:
                     break
     else:
-        with open(fullpath) as file:
+        with _open_read(filepath) as file:
             for line in file:
                 if line[0:len(stopFlag)] != stopFlag:
                     if line[0:len(commentFlag)] == commentFlag:
@@ -449,13 +1256,177 @@ def load_Comments(filepath, commentFlag='#', stopFlag='#'):
         return comments[:]
 
 
-def load_data(filepath, delimiter=',', commentFlag='#', col_labels=None, force_array=False):
+def _read_header(file, commentFlag):
+    """Returns the comment lines at the beginning of a file and the first data line.
+
+    The file is left positioned at the beginning of the first data line (or
+    after it, if file is not seekable). Empty lines are skipped.
+    """
+    header = []
+    seekable = file.seekable()
+    while True:
+        position = file.tell() if seekable else None
+        line = file.readline()
+        if line == '':
+            return header, None
+        if line.startswith(commentFlag):
+            header.append(line)
+        elif line.strip() != '':
+            if seekable:
+                file.seek(position)
+            return header, line
+
+
+def _column_types(line, delimiter, commentFlag):
+    """Returns a list with ``float`` or ``str`` for each column of a data line."""
+    types = []
+    for item in line.split(commentFlag)[0].split(delimiter):
+        try:
+            float(item)
+            types.append(float)
+        except ValueError:
+            types.append(float if item.strip() == '' else str)
+    return types
+
+
+def _read_columns(file, delimiter, commentFlag, types):
+    """Returns the data columns from file or iterator of lines (float arrays or lists of strings).
+
+    Data is parsed in chunks of ``load_chunk_size`` rows by the C parser of
+    ``np.loadtxt``. Raises ValueError if data has missing values (see
+    :py:func:`_read_missing`).
+    """
+    string_cols = [i for i, t in enumerate(types) if t is str]
+    if string_cols:
+        dtype = [(str(i), float if t is float else object) for i, t in enumerate(types)]
+    else:
+        dtype = float
+
+    # the C parser accepts single character delimiters only
+    if delimiter is not None and len(delimiter) > 1:
+        lines = iter(file.readline, '') if hasattr(file, 'readline') else file  # keeps file.tell() available
+        file = (line.replace(delimiter, '\x1f') for line in lines)
+        delimiter = '\x1f'
+
+    chunks = []
+    while True:
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='(loadtxt: input contained no data|Input line)')
+            chunk = np.loadtxt(file, delimiter=delimiter, comments=commentFlag, dtype=dtype, max_rows=load_chunk_size, ndmin=1 if string_cols else 2)
+        if len(chunk) == 0:
+            break
+        chunks.append(chunk)
+    data = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+
+    if string_cols:
+        return [data[str(i)].copy() if t is float else [x.strip() for x in data[str(i)]] for i, t in enumerate(types)]
+    return list(np.ascontiguousarray(data.T))
+
+
+def _read_missing(file, delimiter, commentFlag, types):
+    """Same as :py:func:`_read_columns`, but missing values are read as nan (slower parser)."""
+    dtype = [(str(i), float if t is float else object) for i, t in enumerate(types)]
+    data = np.genfromtxt(file, delimiter=delimiter, comments=commentFlag, dtype=dtype, ndmin=1)
+    return [data[str(i)].copy() if t is float else [x.decode('utf-8').strip() for x in data[str(i)]] for i, t in enumerate(types)]
+
+
+def _parse_data(filepath, delimiter, commentFlag):
+    """Returns header, column types, and columns (None if file has no data) of a data file.
+
+    Compressed files are decompressed on the fly, so memory usage is the same
+    as for uncompressed files.
+    """
+    with _open_read(filepath) as file:
+        header, line = _read_header(file, commentFlag)
+        if line is None:
+            return header, [], None
+        types = _column_types(line, delimiter, commentFlag)
+
+        # non seekable files (zstd) are positioned after the first data line
+        if file.seekable():
+            position = file.tell()
+            lines = file
+        else:
+            lines = itertools.chain([line], file)
+        try:
+            return header, types, _read_columns(lines, delimiter, commentFlag, types)
+        except ValueError:  # missing values
+            if file.seekable():
+                file.seek(position)
+                return header, types, _read_missing(file, delimiter, commentFlag, types)
+
+    # non seekable files must be read again from the beginning
+    with _open_read(filepath) as file:
+        _read_header(file, commentFlag)
+        return header, types, _read_missing(itertools.chain([line], file), delimiter, commentFlag, types)
+
+
+def _cache_folder(filepath):
+    """Returns the folder where the parsed data of filepath is cached."""
+    filepath = Path(filepath).resolve()
+    if cache_dir is None:
+        return filepath.parent/_cache_name/filepath.name
+    return Path(cache_dir)/(filepath.name + '_' + hashlib.md5(str(filepath).encode()).hexdigest() + '.npcache')
+
+
+def _cache_key(filepath, delimiter, commentFlag):
+    """Returns the data that must match for a cache to be valid."""
+    stat = os.stat(filepath)
+    return dict(mtime=stat.st_mtime_ns, size=stat.st_size, delimiter=delimiter, commentFlag=commentFlag)
+
+
+def _load_cache(filepath, delimiter, commentFlag):
+    """Returns header, types, and columns from cache (memory-mapped) or None if cache is missing or outdated."""
+    folder = _cache_folder(filepath)
+    try:
+        with open(str(folder/'meta.json')) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if meta['key'] != _cache_key(filepath, delimiter, commentFlag):
+        return None
+
+    types = [float if t == 'float' else str for t in meta['types']]
+    if meta['empty']:
+        return meta['header'], types, None
+    columns = []
+    for i, t in enumerate(types):
+        column = np.load(folder/f'{i}.npy', mmap_mode='c')
+        columns.append(column if t is float else column.tolist())
+    return meta['header'], types, columns
+
+
+def _save_cache(filepath, delimiter, commentFlag, header, types, columns):
+    """Saves parsed data (one .npy file per column) in the cache folder."""
+    folder = _cache_folder(filepath)
+    folder.mkdir(parents=True, exist_ok=True)
+    meta_path = folder/'meta.json'
+    if meta_path.exists():
+        meta_path.unlink()  # invalidate before overwriting columns
+
+    for i, column in enumerate(columns or []):
+        np.save(folder/f'{i}.npy', np.asarray(column, dtype=None if types[i] is float else str))
+    meta = dict(key=_cache_key(filepath, delimiter, commentFlag),
+                header=header,
+                types=['float' if t is float else 'str' for t in types],
+                empty=columns is None)
+    with open(str(meta_path), 'w') as file:
+        json.dump(meta, file)
+
+
+def load_data(filepath, delimiter=',', commentFlag='#', col_labels=None, force_array=False, cache=False):
     """Load data from text file. Data is formated in a dictionary or array.
 
     The dictionary keys are set as the label of the corresponding data columns, where
     the last comment line before data starts is assumed to have the labels of each data column.
     If column labels cannot be found, data is imported as an array.
 
+    The file is read only once: the header and the type of each column (number
+    or string) are obtained from the first lines, then data is parsed in
+    chunks of ``load_chunk_size`` rows by the C parser of ``np.loadtxt``.
+    Columns with strings are returned as lists. Compressed files (``.gz``,
+    ``.zst``, or ``.lz4``) are decompressed on the fly while parsing.
+
     Warning:
         This function has not been fully tested.
 
@@ -472,6 +1443,14 @@ def load_data(filepath, delimiter=',', commentFlag='#', col_labels=None, force_a
             Tip:
                 To avoid importing a data column, use ``col_labels`` and put an asterisk (*) in front of the corresponding label.
         force_array (bool, optional): If ``force_array=True``, data it will be returned in a array.
+        cache (bool, optional): If True, parsed data is saved in binary format
+            (one ``.npy`` file per column) in a ``.npcache/<filename>`` folder
+            next to the file (or in ``filemanip.cache_dir``). Next calls
+            memory-map the columns instead of parsing the file. The cache is
+            refreshed automatically if the file is modified (size or
+            modification time change) or if ``delimiter`` or ``commentFlag``
+            are different. Memory-mapped arrays are copy-on-write, i.e.,
+            changes are not saved to the cache.
 
     Returns:
         Dictionary or array.
@@ -481,41 +1460,442 @@ def load_data(filepath, delimiter=',', commentFlag='#', col_labels=None, force_a
     """
     filepath = Path(filepath)
 
-    # get header
-    header = load_Comments(filepath, commentFlag=commentFlag, stopFlag=commentFlag)
-
-    # get data
     if delimiter == ' ':
         delimiter = None
-    data = np.genfromtxt(str(filepath), delimiter=delimiter, comments=commentFlag)
+
+    parsed = _load_cache(filepath, delimiter, commentFlag) if cache else None
+    if parsed is None:
+        parsed = _parse_data(filepath, delimiter, commentFlag)
+        if cache:
+            _save_cache(filepath, delimiter, commentFlag, *parsed)
+    header, types, columns = parsed
 
     # col_labels
     if col_labels is None:
-        if header == -1:
-            warnings.warn('Cannot find header. Importing an array.')
-            return data
-        elif force_array:
-            return data
+        if header == [] or force_array:
+            if header == []:
+                warnings.warn('Cannot find header. Importing an array.')
+            # strings are imported as nan
+            data = np.array([col if t is float else np.full(len(col), np.nan) for col, t in zip(columns or [], types)]).T
+            # single row or single column files are returned as 1d arrays (like np.genfromtxt)
+            return np.squeeze(data)
         else:
             col_labels = header[-1].replace(commentFlag, '').strip()
             col_labels = col_labels.replace('\n', '').split(delimiter)
             # remove empty itens and trailing spaces
             col_labels = [item.strip() for item in col_labels if item != '']
 
+    # file without data
+    if columns is None:
+        columns = [np.array([]) for label in col_labels]
+
     # create dict
-    datadict = {col_labels[i]: data[:, i] for i in range(len(col_labels)) if not col_labels[i].startswith('*')}
+    return {col_labels[i]: columns[i] for i in range(len(col_labels)) if not col_labels[i].startswith('*')}
+
 
-    # if a column returns only nan, this column is read as string
-    for key in datadict:
-        if False in [x for x in datadict[key] != datadict[key]]:  # test if the whole col is nan
-            pass
+def _stack(stacked, data, i, n):
+    """Puts data (returned by load_data) in row i of stacked (preallocated for n files if None)."""
+    if stacked is None:
+        if isinstance(data, dict):
+            stacked = {key: np.empty((n, len(data[key])), dtype=float if isinstance(data[key], np.ndarray) else object) for key in data}
         else:
-            # key conversion to col number
-            col_string = col_labels.index(key)
-            data = np.genfromtxt(filepath, delimiter=None, comments='#', usecols=[-1], dtype='S8')
-            datadict[key] = [x.decode('utf-8') for x in data]
+            stacked = np.empty((n, ) + np.shape(data))
+
+    if isinstance(stacked, dict):
+        if list(stacked) != list(data):
+            raise ValueError('Cannot stack data. Files have different column labels.')
+        for key in data:
+            if len(data[key]) != stacked[key].shape[1]:
+                raise ValueError(f"Cannot stack data. Column '{key}' has different lengths.")
+            stacked[key][i] = data[key]
+    else:
+        if np.shape(data) != stacked.shape[1:]:
+            raise ValueError('Cannot stack data. Arrays have different shapes.')
+        stacked[i] = data
+    return stacked
+
+
+def load_many(files, workers=None, executor='thread', stack=False, max_pending=None, **kwargs):
+    """Load many data files in parallel with :py:func:`load_data`.
+
+    Example:
+        >>> data = load_many(parsed_filelist('scans', '.dat'), workers=8)
+
+    Args:
+        files (dict or list): filepaths. Usually, a dictionary returned by
+            :py:func:`parsed_filelist`.
+        workers (int, optional): number of threads or processes. If None, the
+            default of ``concurrent.futures`` is used.
+        executor (str, optional): ``'thread'`` or ``'process'``. Threads are
+            enough for most files, since parsing is done by numpy (which
+            releases the GIL). Use processes for files with string columns.
+        stack (bool, optional): if True, columns are stored in preallocated 2d
+            arrays as files are loaded, where row i is the data of the i-th
+            file. All files must have the same column labels and number of
+            rows.
+        max_pending (int, optional): max. number of files being loaded (or
+            loaded, but not yet stored) at the same time, which limits memory
+            usage. Default is twice the number of workers (or CPUs).
+        **kwargs: arguments passed to :py:func:`load_data`.
+
+    Returns:
+        If ``stack=False``, an ordered dictionary where keys are the same of
+        ``files`` (or the filepaths, if files is a list) and values are the
+        data returned by :py:func:`load_data`. If ``stack=True``, a
+        dictionary (or an array) with the data of all files stacked.
+
+    See Also:
+        :py:func:`load_data`, :py:func:`parsed_filelist`
+    """
+    if not isinstance(files, dict):
+        files = collections.OrderedDict((filepath, filepath) for filepath in files)
+    keys = list(files)
+
+    if executor == 'thread':
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    elif executor == 'process':
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    else:
+        raise ValueError("executor must be 'thread' or 'process'.")
+    if max_pending is None:
+        max_pending = 2*(workers or os.cpu_count() or 1)
+
+    final = collections.OrderedDict((key, None) for key in keys)
+    stacked = None
+    with executor:
+        todo = collections.deque(range(len(keys)))
+        pending = dict()
+        while todo or pending:
+            while todo and len(pending) < max_pending:
+                i = todo.popleft()
+                pending[executor.submit(load_data, files[keys[i]], **kwargs)] = i
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                if stack:
+                    stacked = _stack(stacked, future.result(), i, len(keys))
+                else:
+                    final[keys[i]] = future.result()
+
+    if stack:
+        return stacked
+    return final
+
+
+def _to_float(string):
+    """Returns float(string) or nan."""
+    try:
+        return float(string)
+    except ValueError:
+        return np.nan
+
+
+class LazyDataFile(collections.abc.Mapping):
+    """Data file with columns that are parsed only when accessed.
 
-    return datadict
+    Dictionary-like object with the same keys of :py:func:`load_data`. The
+    file is memory-mapped and line offsets are indexed once. Columns are
+    parsed on first access and the last ``cache_size`` accessed columns are
+    kept in memory (least recently used columns are discarded and parsed
+    again if needed), so files larger than the available memory can be used.
+
+    If all lines have the same length (e.g. files saved by
+    :py:func:`save_data`), each column is read directly from the
+    memory-mapped file at fixed byte offsets. Otherwise, the byte offsets of
+    each line and field are indexed (in blocks) on first access and each
+    column is read from the offsets.
+
+    Example:
+        >>> with LazyDataFile('data.dat') as data:
+        ...     x, y = data['energy'], data['intensity']
+
+    Args:
+        filepath (str or pathlib.Path): path to file
+        delimiter (str, optional): The string used to separate values. Use ``' '``
+            for whitespaces.
+        commentFlag (str, optional): string indicating comments.
+        col_labels (list, optional): column labels. If None, labels are read
+            from the last comment line before data starts. Put an asterisk (*)
+            in front of a label to ignore the column.
+        cache_size (int, optional): max. number of parsed columns kept in memory.
+
+    Attributes:
+        filepath (pathlib.Path): path to file.
+        header (list): comment lines at the beginning of the file.
+        col_labels (list): column labels.
+        n_rows (int): number of data lines (excluding comments).
+
+    See Also:
+        :py:func:`load_data`
+    """
+
+    def __init__(self, filepath, delimiter=',', commentFlag='#', col_labels=None, cache_size=4):
+        self.filepath = Path(filepath)
+        self.delimiter = None if delimiter == ' ' else delimiter
+        self.commentFlag = commentFlag
+        self.cache_size = cache_size
+        self._columns = collections.OrderedDict()
+
+        if _detect_codec(self.filepath) is not None:
+            raise ValueError('LazyDataFile does not support compressed files. Use load_data().')
+        with open(str(self.filepath), newline='') as file:
+            self.header, line = _read_header(file, commentFlag)
+            self._start = file.tell()
+        self._types = [] if line is None else _column_types(line, self.delimiter, commentFlag)
+
+        if col_labels is None:
+            if self.header == []:
+                raise ValueError('Cannot find header. Use col_labels.')
+            col_labels = self.header[-1].replace(commentFlag, '').strip()
+            col_labels = [item.strip() for item in col_labels.split(self.delimiter) if item != '']
+        self.col_labels = list(col_labels)
+        self._keys = [label for label in self.col_labels if not label.startswith('*')]
+
+        self._file = open(str(self.filepath), 'rb')
+        if line is None:
+            self._mmap = None
+            self._buffer = np.zeros(0, dtype=np.uint8)
+        else:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buffer = np.frombuffer(self._mmap, dtype=np.uint8)
+        self._index_lines()
+        self._field_offsets = None
+        # comments after data (or comment lines between data lines)
+        self._comments = self._mmap is not None and self._mmap.find(commentFlag.encode(), self._start) != -1
+
+    # number of bytes searched for newlines at a time
+    _block_size = 2**26
+
+    def _index_lines(self):
+        """Finds the data lines (not empty and not comments), reading the file in blocks.
+
+        If all lines have the same length, only the line length is kept (line
+        offsets are computed when needed). Otherwise, the start and end byte
+        offsets of data lines are saved.
+        """
+        self.n_rows = 0
+        self._line_length = None
+        starts, ends = [], []
+        fixed = True
+        position = self._start
+        size = len(self._buffer)
+        while position < size:
+            # blocks end at a newline
+            stop = self._mmap.find(b'\n', min(position + self._block_size, size) - 1)
+            stop = size if stop == -1 else stop + 1
+            line_ends = position + np.flatnonzero(self._buffer[position:stop] == ord('\n'))
+            if stop == size and self._buffer[-1] != ord('\n'):
+                line_ends = np.append(line_ends, size)
+            line_starts = np.append(position, line_ends[:-1] + 1)
+            lengths = line_ends - line_starts
+            position = stop
+
+            # data lines (not empty and not comments)
+            comment = np.ones(len(lengths), dtype=bool)
+            for n, char in enumerate(self.commentFlag.encode()):
+                comment &= lengths > n
+                comment[comment] = self._buffer[line_starts[comment] + n] == char
+            data = (lengths > 0) & ~comment
+
+            if fixed:
+                if self._line_length is None:
+                    self._line_length = int(lengths[0]) + 1
+                if np.all(data) and np.all(lengths == self._line_length - 1):
+                    self.n_rows += len(lengths)
+                    continue
+                # lines from previous blocks
+                fixed = False
+                starts.append(self._start + self._line_length*np.arange(self.n_rows))
+                ends.append(starts[-1] + self._line_length - 1)
+                self._line_length = None
+            starts.append(line_starts[data])
+            ends.append(line_ends[data])
+            self.n_rows += len(starts[-1])
+
+        self._fixed = fixed and self.n_rows > 0
+        self._starts = None if fixed else np.concatenate(starts)
+        self._ends = None if fixed else np.concatenate(ends)
+
+    def __repr__(self):
+        return f"LazyDataFile('{self.filepath}', col_labels={self._keys}, n_rows={self.n_rows})"
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key in self._columns:
+            self._columns.move_to_end(key)
+            return self._columns[key]
+
+        column = self._parse(self.col_labels.index(key))
+        self._columns[key] = column
+        if len(self._columns) > self.cache_size:
+            self._columns.popitem(last=False)
+        return column
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the file. Parsed columns are discarded."""
+        self._columns.clear()
+        self._buffer = None
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def _fields(self, i):
+        """Returns the byte offsets (start, stop) of column i within a line, or None if lines are not fixed width."""
+        if not self._fixed or self._comments or self.delimiter is None or len(self.delimiter) != 1:
+            return None
+        line = bytes(self._buffer[self._start:self._start + self._line_length - 1])
+        delimiters = [-1] + [n for n, char in enumerate(line) if char == ord(self.delimiter)] + [len(line)]
+        if len(delimiters) - 1 != len(self._types):
+            return None
+        start, stop = delimiters[i] + 1, delimiters[i + 1]
+
+        # all lines must have delimiters at the same positions
+        for position in (start - 1, stop):
+            if 0 <= position < len(line):
+                if np.any(self._buffer[self._start + position::self._line_length] != ord(self.delimiter)):
+                    return None
+        return start, stop
+
+    def _line_offsets(self, start, stop):
+        """Returns the start and end (excluding line breaks and comments) byte offsets of data lines from start to stop."""
+        if self._fixed:
+            starts = self._start + self._line_length*np.arange(start, min(stop, self.n_rows))
+            ends = starts + self._line_length - 1
+        else:
+            starts, ends = self._starts[start:stop], self._ends[start:stop].copy()
+        ends[self._buffer[ends - 1] == ord('\r')] -= 1
+
+        # lines end at the first comment flag
+        if self._comments and len(starts) > 0:
+            flag = self.commentFlag.encode()
+            block = self._buffer[starts[0]:ends[-1]]
+            if len(flag) == 1:
+                flags = starts[0] + np.flatnonzero(block == flag[0])
+            else:
+                flags = np.array([match.start() for match in re.finditer(re.escape(flag), block.tobytes())], dtype=np.int64) + starts[0]
+            rows = np.searchsorted(starts, flags, side='right') - 1
+            inside = flags < ends[rows]
+            np.minimum.at(ends, rows[inside], flags[inside])
+        return starts, ends
+
+    def _index_fields(self):
+        """Returns the start and end byte offsets of each field (relative to the beginning of the line).
+
+        Returns:
+            two arrays with shape (n_rows, number of columns) or None if lines
+            do not have the same number of fields.
+        """
+        if self._field_offsets is not None:
+            return self._field_offsets or None
+
+        n_cols = len(self._types)
+        field_starts, field_ends = [], []
+        for start in range(0, self.n_rows, load_chunk_size):
+            starts, ends = self._line_offsets(start, start + load_chunk_size)
+            block = self._buffer[starts[0]:ends[-1]]
+            if self.delimiter is None:
+                separator = (block == ord(' ')) | (block == ord('\t')) | (block == ord('\n')) | (block == ord('\r'))
+                begin = ~separator & np.append(True, separator[:-1])
+                end = ~separator & np.append(separator[1:], True)
+                positions = (starts[0] + np.flatnonzero(begin), starts[0] + np.flatnonzero(end) + 1)
+                n_fields = n_cols
+            else:
+                delimiter = self.delimiter.encode()
+                if len(delimiter) == 1:
+                    delimiters = starts[0] + np.flatnonzero(block == delimiter[0])
+                else:
+                    delimiters = np.array([match.start() for match in re.finditer(re.escape(delimiter), block.tobytes())], dtype=np.int64) + starts[0]
+                positions = (delimiters, )
+                n_fields = n_cols - 1
+
+            # remove positions in comment lines (between data lines)
+            rows = np.searchsorted(starts, positions[0], side='right') - 1
+            if self.delimiter is None:  # fields followed by a comment
+                positions = (positions[0], np.minimum(positions[1], ends[rows]))
+            inside = positions[0] < ends[rows]
+            rows = rows[inside]
+            positions = [p[inside].reshape(-1, n_fields) if n_fields > 0 else np.zeros((len(starts), 0), dtype=np.int64) for p in positions]
+            if np.any(np.bincount(rows, minlength=len(starts)) != n_fields):
+                self._field_offsets = False
+                return None
+
+            if self.delimiter is None:
+                field_starts.append(positions[0] - starts[:, None])
+                field_ends.append(positions[1] - starts[:, None])
+            else:
+                length = len(self.delimiter.encode())
+                field_starts.append(np.column_stack((starts, positions[0] + length)) - starts[:, None])
+                field_ends.append(np.column_stack((positions[0], ends)) - starts[:, None])
+
+        dtype = np.uint16 if max(int(np.max(ends)) for ends in field_ends) < 2**16 else np.int64
+        self._field_offsets = (np.concatenate(field_starts).astype(dtype), np.concatenate(field_ends).astype(dtype))
+        return self._field_offsets
+
+    def _parse(self, i):
+        """Returns column i (float array or list of strings)."""
+        if self._mmap is None or self.n_rows == 0:
+            return np.array([])
+
+        fields = self._fields(i)
+        if fields is not None:
+            start, stop = fields
+            column = np.ndarray((self.n_rows, ), dtype=f'S{stop - start}', buffer=self._mmap,
+                                offset=self._start + start, strides=(self._line_length, ))
+            if self._types[i] is float:
+                try:
+                    return column.astype(float)
+                except ValueError:  # missing values
+                    pass
+            else:
+                return [x.decode('utf-8').strip() for x in column]
+
+        offsets = self._index_fields()
+        if offsets is not None:
+            chunks = []
+            for start in range(0, self.n_rows, load_chunk_size):
+                starts, ends = self._line_offsets(start, start + load_chunk_size)
+                field_starts = starts + offsets[0][start:start + load_chunk_size, i]
+                lengths = offsets[1][start:start + load_chunk_size, i].astype(np.int64) - offsets[0][start:start + load_chunk_size, i]
+                width = max(int(np.max(lengths)), 1)
+                columns = np.arange(width)
+                inside = columns < lengths[:, None]
+                chars = self._buffer[np.where(inside, field_starts[:, None] + columns, 0)]
+                chars[~inside] = 0
+                chunks.append(chars.view(f'S{width}').ravel())
+            column = np.concatenate(chunks)
+            if self._types[i] is not float:
+                return [x.decode('utf-8').strip() for x in column]
+            try:
+                return column.astype(float)
+            except ValueError:  # missing values
+                return np.array([_to_float(x) for x in column])
+
+        self._mmap.seek(self._start)
+        lines = (line.decode('utf-8') for line in iter(self._mmap.readline, b''))
+        if self._types[i] is float:
+            try:
+                with warnings.catch_warnings():
+                    warnings.filterwarnings('ignore', message='(loadtxt: input contained no data|Input line)')
+                    return np.loadtxt(lines, delimiter=self.delimiter, comments=self.commentFlag, usecols=i, ndmin=1)
+            except ValueError:  # missing values (slower parser)
+                self._mmap.seek(self._start)
+                lines = (line.decode('utf-8') for line in iter(self._mmap.readline, b''))
+                return np.genfromtxt(lines, delimiter=self.delimiter, comments=self.commentFlag, usecols=i, ndmin=1)
+        column = np.loadtxt(lines, delimiter=self.delimiter, comments=self.commentFlag, usecols=i, dtype=object, ndmin=1)
+        return [x.strip() for x in column]
 
 
 
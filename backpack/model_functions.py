@@ -3,10 +3,232 @@
 """Everyday use mathematical functions and distributions."""
 
 import numpy as np
-from scipy.special import erf
+import math
+import threading
+import functools
+import collections
+import inspect
+from scipy import fft, sparse
+from scipy.special import erf, erfcx, wofz
+
+try:
+    import numexpr
+except ModuleNotFoundError:
+    numexpr = None
+
+try:
+    import numba
+except ModuleNotFoundError:
+    numba = None
+
+# backend used by model functions: 'numpy', 'numexpr', 'numba', or None
+# (numba if installed and running on more than one thread, or numexpr if
+# installed, for arrays larger than the sizes below).
+# It can be overwritten per call with the keyword argument ``backend``.
+# Backends that are not installed fall back to numpy.
+default_backend = None
+
+# arrays smaller than this are evaluated by numpy even if numexpr is installed
+numexpr_min_size = 10000
+# arrays smaller than this are evaluated by numpy even if numba is installed
+numba_min_size = 1000
+
+_sqrt2pi = np.sqrt(2*np.pi)
+_sqrtpi = np.sqrt(np.pi)
+_4ln2 = 4*np.log(2)
+_2sqrtln2 = 2*np.sqrt(np.log(2))
+_buffers = threading.local()
+
+# Voigt profiles of arrays larger than this are interpolated from a table
+voigt_table_min_size = 100000
+# table step in units of the profile width (max. relative error ~1e-5)
+voigt_table_step = 0.01
+
+# max. absolute error of the erf lookup table used by fwhmErr(..., table=True)
+erf_table_tol = 1e-7
+_erf_table_range = 6  # erfc(6) ~ 2e-17
+_erf_tables = dict()
+
+# broadening kernels are truncated at this number of standard deviations
+broadening_cutoff = 5
+# cached broadening kernels and Voigt tables (least recently used are discarded)
+_kernel_cache = collections.OrderedDict()
+_kernel_cache_size = 16
+
+
+def _float_dtype(x):
+    """Returns the dtype used to evaluate x.
+
+    Floating point arrays (e.g. float32) keep their dtype. Other arrays are
+    evaluated as float64.
+    """
+    dtype = np.asarray(x).dtype
+    return dtype if np.issubdtype(dtype, np.floating) else np.dtype(float)
+
+
+@functools.lru_cache(maxsize=None)
+def _constants(dtype):
+    """Returns constants used in array operations (computed once per dtype)."""
+    dtype = np.dtype(dtype)
+    return dict(one=dtype.type(1), half_pi=dtype.type(np.pi/2))
+
+
+def _cast(out, *args):
+    """Returns args (scalars or arrays) converted to the dtype of out.
+
+    Parameters given as python or float64 scalars would otherwise upcast
+    float32 arrays to float64.
+    """
+    return [np.asarray(arg, dtype=out.dtype) for arg in args]
 
 
-def Gauss(x, amp, c, sigma):
+def _empty(x, *args, out=None):
+    """Returns ``out`` or a new array with the broadcasted shape of x and args (same dtype of x)."""
+    if out is None:
+        shape = np.broadcast_shapes(np.shape(x), *[np.shape(arg) for arg in args])
+        out = np.empty(shape, dtype=_float_dtype(x))
+    return out
+
+
+def _scratch(out):
+    """Returns a scratch array like ``out`` which is reused between calls (per thread)."""
+    scratch = getattr(_buffers, 'scratch', None)
+    if scratch is None or scratch.shape != out.shape or scratch.dtype != out.dtype:
+        scratch = np.empty_like(out)
+        _buffers.scratch = scratch
+    return scratch
+
+
+def _get_backend(x, backend, out, *args):
+    """Returns the backend used to evaluate x.
+
+    Numba kernels take scalar parameters only and write to a contiguous
+    ``out`` with the same shape of x, otherwise numpy is used.
+    """
+    if backend is None:
+        backend = default_backend
+    if backend is None:
+        if numba is not None and numba.config.NUMBA_NUM_THREADS > 1 and np.size(x) >= numba_min_size:
+            backend = 'numba'
+        elif numexpr is not None and np.size(x) >= numexpr_min_size:
+            backend = 'numexpr'
+        else:
+            backend = 'numpy'
+    elif backend not in ('numpy', 'numexpr', 'numba'):
+        raise ValueError("backend must be 'numpy', 'numexpr', 'numba', or None.")
+
+    if backend == 'numexpr' and numexpr is None:
+        return 'numpy'
+    if backend == 'numba':
+        if numba is None or np.shape(x) != out.shape or not out.flags.c_contiguous or any(np.ndim(arg) for arg in args):
+            return 'numpy'
+    return backend
+
+
+def _flat(x, out):
+    """Returns x and out as 1d arrays of the same dtype (out is a view)."""
+    return np.ravel(x).astype(out.dtype, copy=False), out.reshape(-1)
+
+
+if numba is not None:
+    # compiled on first call (per dtype) and cached to disk (__pycache__)
+    @numba.njit(parallel=True, cache=True)
+    def _gauss_numba(x, amp, c, k, out):
+        for i in numba.prange(x.size):
+            d = x[i] - c
+            out[i] = amp*np.exp(-k*d*d)
+
+    @numba.njit(parallel=True, cache=True)
+    def _lorentz_numba(x, amp, c, w2, out):
+        for i in numba.prange(x.size):
+            d = x[i] - c
+            out[i] = amp*w2/(w2 + d*d)
+
+    @numba.njit(parallel=True, cache=True)
+    def _pseudo_voigt_numba(x, amp_l, amp_g, c, w2, k, out):
+        for i in numba.prange(x.size):
+            d2 = (x[i] - c)**2
+            out[i] = amp_l*w2/(w2 + d2) + amp_g*np.exp(-k*d2)
+
+    @numba.njit(parallel=True, cache=True)
+    def _arctan_numba(x, amp, c, w_inv, out):
+        for i in numba.prange(x.size):
+            out[i] = amp*(np.arctan((x[i] - c)*w_inv) + np.pi/2)/np.pi
+
+    @numba.njit(parallel=True, cache=True)
+    def _erf_numba(x, amp, c, factor, out):
+        for i in numba.prange(x.size):
+            out[i] = amp*(1 + math.erf((x[i] - c)*factor))/2
+
+
+def _gauss_kernel(x, amp, c, k, out=None, backend=None):
+    """Returns ``amp*exp(-k*(x-c)**2)`` in a single pass (no temporaries)."""
+    x = np.asarray(x)
+    out = _empty(x, amp, c, k, out=out)
+    amp, c, k = _cast(out, amp, c, k)
+    backend = _get_backend(x, backend, out, amp, c, k)
+    if backend == 'numba':
+        x_flat, out_flat = _flat(x, out)
+        _gauss_numba(x_flat, amp[()], c[()], k[()], out_flat)
+        return out
+    if backend == 'numexpr':
+        return numexpr.evaluate('amp*exp(-k*(x-c)**2)', local_dict=dict(x=x, amp=amp, c=c, k=k), out=out, casting='same_kind')
+    np.subtract(x, c, out=out)
+    np.square(out, out=out)
+    np.multiply(out, -k, out=out)
+    np.exp(out, out=out)
+    np.multiply(out, amp, out=out)
+    return out
+
+
+def _lorentz_kernel(x, amp, c, w2, out=None, backend=None):
+    """Returns ``amp*w2/(w2 + (x-c)**2)`` in a single pass (no temporaries)."""
+    x = np.asarray(x)
+    out = _empty(x, amp, c, w2, out=out)
+    amp, c, w2 = _cast(out, amp, c, w2)
+    backend = _get_backend(x, backend, out, amp, c, w2)
+    if backend == 'numba':
+        x_flat, out_flat = _flat(x, out)
+        _lorentz_numba(x_flat, amp[()], c[()], w2[()], out_flat)
+        return out
+    if backend == 'numexpr':
+        return numexpr.evaluate('amp*w2/(w2 + (x-c)**2)', local_dict=dict(x=x, amp=amp, c=c, w2=w2), out=out, casting='same_kind')
+    np.subtract(x, c, out=out)
+    np.square(out, out=out)
+    np.add(out, w2, out=out)
+    np.divide(amp*w2, out, out=out)
+    return out
+
+
+def _pseudo_voigt_kernel(x, amp_l, amp_g, c, w2, k, out=None, backend=None):
+    """Returns ``amp_l*w2/(w2 + (x-c)**2) + amp_g*exp(-k*(x-c)**2)``.
+
+    ``(x-c)**2`` is computed only once and a single (reused) scratch array is
+    needed.
+    """
+    x = np.asarray(x)
+    out = _empty(x, amp_l, amp_g, c, w2, k, out=out)
+    amp_l, amp_g, c, w2, k = _cast(out, amp_l, amp_g, c, w2, k)
+    backend = _get_backend(x, backend, out, amp_l, amp_g, c, w2, k)
+    if backend == 'numba':
+        x_flat, out_flat = _flat(x, out)
+        _pseudo_voigt_numba(x_flat, amp_l[()], amp_g[()], c[()], w2[()], k[()], out_flat)
+        return out
+    if backend == 'numexpr':
+        return numexpr.evaluate('amp_l*w2/(w2 + (x-c)**2) + amp_g*exp(-k*(x-c)**2)', local_dict=dict(x=x, amp_l=amp_l, amp_g=amp_g, c=c, w2=w2, k=k), out=out, casting='same_kind')
+    np.subtract(x, c, out=out)
+    np.square(out, out=out)
+    scratch = _scratch(out)
+    np.multiply(out, -k, out=scratch)
+    np.exp(scratch, out=scratch)
+    np.multiply(scratch, amp_g, out=scratch)
+    np.add(out, w2, out=out)
+    np.divide(amp_l*w2, out, out=out)
+    np.add(out, scratch, out=out)
+    return out
+
+
+def Gauss(x, amp, c, sigma, *, out=None, backend=None):
     r"""Gaussian distribution.
 
     .. math:: y(x) = \text{amp } e^{-\frac{(x-c)^2}{2 \sigma^2}}
@@ -24,12 +246,14 @@ def Gauss(x, amp, c, sigma):
     :param amp: Amplitude
     :param c: Center
     :param sigma: standard deviation
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    return amp*np.exp(-(x-c)**2/(2*sigma**2))
+    return _gauss_kernel(x, amp, c, 1/(2*sigma**2), out=out, backend=backend)
 
 
-def areaGauss(x, A, c, sigma):
+def areaGauss(x, A, c, sigma, *, out=None, backend=None):
     r"""Gaussian distribution.
 
     .. math:: y(x) = \frac{\text{Area}}{\sqrt{2\pi} w} e^{-\frac{(x-c)^2}{2 w^2}}
@@ -38,13 +262,15 @@ def areaGauss(x, A, c, sigma):
     :param A: Area
     :param c: Center
     :param sigma: standard deviation
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    return Gauss(x, A/(np.sqrt(2*np.pi)*sigma), c, sigma)
+    return Gauss(x, A/(_sqrt2pi*sigma), c, sigma, out=out, backend=backend)
     # return A/(np.sqrt(2*np.pi)*abs(w))  *np.exp(-(x-c)**2/(2*w**2))
 
 
-def fwhmGauss(x, amp, c, w):
+def fwhmGauss(x, amp, c, w, *, out=None, backend=None):
     r"""Gaussian distribution.
 
     .. math:: y(x) = \text{amp } e^{-\frac{4 \ln(2) (x-c)^2}{w^2}}
@@ -57,13 +283,15 @@ def fwhmGauss(x, amp, c, w):
     :param A: Amplitude
     :param c: Center
     :param w: FWHM
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    return Gauss(x, amp, c, w/(2*np.sqrt(2*np.log(2))))
+    return _gauss_kernel(x, amp, c, _4ln2/w**2, out=out, backend=backend)
     # return A*np.exp((-4*np.log(2)*((x-c)**2))/(w**2))
 
 
-def fwhmAreaGauss(x, A, c, w):
+def fwhmAreaGauss(x, A, c, w, *, out=None, backend=None):
     r"""Gaussian distribution.
 
     .. math:: y(x) = \frac{2 \sqrt{\ln(2)} A}{w \sqrt{\pi}}  e^{-\frac{4 \ln(2) (x-c)^2}{w^2}}
@@ -72,14 +300,15 @@ def fwhmAreaGauss(x, A, c, w):
     :param A: Area
     :param c: Center
     :param w: FWHM
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    w = w/(2*np.sqrt(2*np.log(2)))
-    return Gauss(x, A/(np.sqrt(2*np.pi)*w), c, w)
+    return _gauss_kernel(x, A*_2sqrtln2/(w*_sqrtpi), c, _4ln2/w**2, out=out, backend=backend)
     # return (A/(w*np.sqrt(np.pi/4*np.log(2))))*np.exp((-4*np.log(2)*((x-c)**2))/(w**2))
 
 
-def Lorentz(x, gamma, c):
+def Lorentz(x, gamma, c, *, out=None, backend=None):
     r"""Cauchy–Lorentz distribution.
 
     .. math:: y(x) = \frac{1}{\pi \gamma} \frac{\gamma^2}{\gamma^2 + (x-c)^2}
@@ -99,12 +328,14 @@ def Lorentz(x, gamma, c):
     :param x: x array
     :param gamma: Scale factor
     :param c: Center
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    return (1/(np.pi*gamma))*((gamma**2)/(gamma**2 + (x-c)**2))
+    return _lorentz_kernel(x, 1/(np.pi*gamma), c, gamma**2, out=out, backend=backend)
 
 
-def fwhmLorentz(x, amp, c, w):
+def fwhmLorentz(x, amp, c, w, *, out=None, backend=None):
     r"""Cauchy–Lorentz distribution.
 
     .. math:: y(x) = \text{amp } \frac{w^2}{w^2 + (x-c)^2}
@@ -117,13 +348,15 @@ def fwhmLorentz(x, amp, c, w):
     :param amp: Amplitude
     :param c: Center
     :param w: FWHM
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    return amp*(np.pi*w) * Lorentz(x, gamma=w, c=c)
+    return _lorentz_kernel(x, amp, c, w**2, out=out, backend=backend)
     # return A*((w**2)/(w**2 + 4* (x-c)**2))
 
 
-def fwhmAreaLorentz(x, A, c, w):
+def fwhmAreaLorentz(x, A, c, w, *, out=None, backend=None):
     r"""Cauchy–Lorentz distribution.
 
     .. math:: y(x) = A \frac{1}{\pi w} \frac{w^2}{w^2 + (x-c)^2}
@@ -132,13 +365,15 @@ def fwhmAreaLorentz(x, A, c, w):
     :param A: Area
     :param c: Center
     :param w: FWHM
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    return A * Lorentz(x, gamma=w, c=c)
+    return _lorentz_kernel(x, A/(np.pi*w), c, w**2, out=out, backend=backend)
     # return ((2*A)/(np.pi))*((w)/(w**2 + 4*(x-c)**2))
 
 
-def fwhmVoigt(x, amp, c, w, m):
+def fwhmVoigt(x, amp, c, w, m, *, out=None, backend=None):
     r"""Pseudo-voigt curve.
 
     .. math:: y(x) = A \left[ m  \frac{w^2}{w^2 + (x-c)^2}   + (1-m) e^{-\frac{4 \ln(2) (x-c)^2}{w^2}} \right]
@@ -148,15 +383,14 @@ def fwhmVoigt(x, amp, c, w, m):
     :param c: Center
     :param w: FWHM
     :param m: Factor from 1 to 0 of the lorentzian amount
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    lorentz = fwhmLorentz(x, 1, c, w)
-    gauss = fwhmGauss(x, 1, c, w)
+    return _pseudo_voigt_kernel(x, amp*m, amp*(1-m), c, w**2, _4ln2/w**2, out=out, backend=backend)
 
-    return amp*(m*lorentz + (1-m)*gauss)
 
-
-def fwhmAreaVoigt(x, A, c, w, m):
+def fwhmAreaVoigt(x, A, c, w, m, *, out=None, backend=None):
     r"""Pseudo-voigt curve.
 
     .. math:: y(x) = A \left[ m \frac{1}{\pi w} \frac{w^2}{w^2 + 4 (x-c)^2}   + (1-m) \frac{2 \sqrt{\ln(2)}}{w \sqrt{\pi}}  e^{-\frac{4 \ln(2) (x-c)^2}{w^2}} \right]
@@ -170,30 +404,239 @@ def fwhmAreaVoigt(x, A, c, w, m):
     :param c: Center
     :param w: FWHM
     :param m: Factor from 1 to 0 of the lorentzian amount
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numexpr'``, ``'numba'``, or None (see ``default_backend``)
     :return: :math:`y(x)`
     """
-    lorentz = fwhmAreaLorentz(x, 1, c, w)
-    gauss = fwhmAreaGauss(x, 1, c, w)
+    return _pseudo_voigt_kernel(x, A*m/(np.pi*w), A*(1-m)*_2sqrtln2/(w*_sqrtpi), c, w**2, _4ln2/w**2, out=out, backend=backend)
 
-    return A*(m*lorentz + (1-m)*gauss)
 
+def _faddeeva_real(t, y, method=None):
+    """Returns the real part of the Faddeeva function ``w(t + iy)`` for real t.
 
-def fwhmArctan(x, amp, c, w):
-    r"""Arctangent function.
+    If ``method='table'``, ``w`` is calculated on a uniform grid (step
+    proportional to the profile width) and linearly interpolated. If
+    ``method=None``, the table is used for large arrays when the table is
+    much smaller than t. Tables are cached (see :py:func:`_faddeeva_table`).
+    If y is an array, ``w`` is always calculated exactly.
+    """
+    if method not in (None, 'table', 'exact'):
+        raise ValueError("method must be 'exact', 'table', or None.")
+    t = np.asarray(t)
+    if np.ndim(y) > 0:
+        return wofz(t + 1j*np.asarray(y, dtype=t.dtype)).real
+    y = t.dtype.type(y)
+    if method != 'exact' and t.size > 0:
+        step = voigt_table_step*max(1, float(y))
+        k_min, k_max = int(np.floor(np.min(t)/step)), int(np.ceil(np.max(t)/step))
+        if method == 'table' or (t.size >= voigt_table_min_size and k_max - k_min + 1 < t.size/4):
+            grid, table = _faddeeva_table(float(y), step, k_min, k_max, t.dtype)
+            return np.interp(t, grid, table).astype(t.dtype, copy=False)
+    return wofz(t + 1j*y).real
+
+
+def _faddeeva_table(y, step, k_min, k_max, dtype):
+    """Returns grid and ``Re[w(grid + iy)]``, where grid covers (at least) ``k*step`` for k from k_min to k_max.
+
+    Tables are cached for each (y, step, dtype) and extended if a larger
+    range is needed.
+    """
+    key = ('voigt', y, step, np.dtype(dtype))
+    stored = _kernel_get(key)
+    if stored is not None:
+        k0 = int(np.rint(stored[0][0]/step))
+        if k0 <= k_min and k_max <= k0 + len(stored[0]) - 1:
+            return stored
+        k_min, k_max = min(k_min, k0), max(k_max, k0 + len(stored[0]) - 1)
+    grid = np.arange(k_min, k_max + 1)*step
+    stored = (grid, wofz(grid + 1j*y).real.astype(dtype, copy=False))
+    _kernel_set(key, stored)
+    return stored
 
-    .. math:: y(x) =   \frac{A}{\pi} \left[ \arctan(\frac{1}{w}(x-c)) + \frac{\pi}{2} \right]
+
+def Voigt(x, amp, c, sigma, gamma, *, method=None):
+    r"""Voigt profile (convolution of a Gaussian and a Lorentzian).
+
+    .. math:: y(x) = \text{amp } \frac{\text{Re}[w(z)]}{\text{Re}[w(z_0)]}
+
+    where :math:`w(z)` is the `Faddeeva function <https://docs.scipy.org/doc/scipy/reference/generated/scipy.special.wofz.html>`_,
+
+    .. math:: z = \frac{x-c + i\gamma}{\sigma \sqrt{2}}, \qquad z_0 = \frac{i\gamma}{\sigma \sqrt{2}}
+
+    and,
+
+    .. math:: \text{Area }= \text{amp } \frac{\sigma \sqrt{2 \pi}}{\text{Re}[w(z_0)]}
+
+    Note:
+        The Voigt FWHM can be calculated from the Gaussian and Lorentzian
+        FWHMs by :py:func:`voigtFWHM`.
 
     :param x: x array
     :param amp: Amplitude
     :param c: Center
-    :param w: FWHM (it will take fwhm units to go from amp/4 to (3amp)/4)
+    :param sigma: standard deviation of the gaussian
+    :param gamma: half width at half maximum of the lorentzian
+    :param method: ``'exact'``, ``'table'`` (interpolated), or ``None`` (table is used for large arrays)
+    :return: :math:`y(x)`
+    """
+    x = np.asarray(x)
+    dtype = _float_dtype(x)
+    u = 1/(sigma*np.sqrt(2))
+    real = _faddeeva_real((x - dtype.type(c))*dtype.type(u), gamma*u, method=method)
+    real *= dtype.type(amp/erfcx(gamma*u))
+    return real
+
+
+def areaVoigt(x, A, c, sigma, gamma, *, method=None):
+    r"""Voigt profile (convolution of a Gaussian and a Lorentzian).
+
+    .. math:: y(x) = \frac{A}{\sigma \sqrt{2 \pi}} \text{Re}[w(z)], \qquad z = \frac{x-c + i\gamma}{\sigma \sqrt{2}}
+
+    where :math:`w(z)` is the Faddeeva function.
+
+    :param x: x array
+    :param A: Area
+    :param c: Center
+    :param sigma: standard deviation of the gaussian
+    :param gamma: half width at half maximum of the lorentzian
+    :param method: ``'exact'``, ``'table'`` (interpolated), or ``None`` (table is used for large arrays)
+    :return: :math:`y(x)`
+    """
+    x = np.asarray(x)
+    dtype = _float_dtype(x)
+    u = 1/(sigma*np.sqrt(2))
+    real = _faddeeva_real((x - dtype.type(c))*dtype.type(u), gamma*u, method=method)
+    real *= dtype.type(A/(sigma*_sqrt2pi))
+    return real
+
+
+def fwhmExactVoigt(x, amp, c, wg, wl, *, method=None):
+    r"""Voigt profile parametrized by the gaussian and lorentzian FWHMs.
+
+    Same as :py:func:`Voigt` with :math:`\sigma = w_g/(2 \sqrt{2 \ln(2)})` and :math:`\gamma = w_l/2`.
+
+    :param x: x array
+    :param amp: Amplitude
+    :param c: Center
+    :param wg: FWHM of the gaussian
+    :param wl: FWHM of the lorentzian
+    :param method: ``'exact'``, ``'table'`` (interpolated), or ``None`` (table is used for large arrays)
+    :return: :math:`y(x)`
+    """
+    return Voigt(x, amp, c, wg/np.sqrt(2*_4ln2), wl/2, method=method)
+
+
+def fwhmAreaExactVoigt(x, A, c, wg, wl, *, method=None):
+    r"""Voigt profile parametrized by the area and gaussian and lorentzian FWHMs.
+
+    Same as :py:func:`areaVoigt` with :math:`\sigma = w_g/(2 \sqrt{2 \ln(2)})` and :math:`\gamma = w_l/2`.
+
+    :param x: x array
+    :param A: Area
+    :param c: Center
+    :param wg: FWHM of the gaussian
+    :param wl: FWHM of the lorentzian
+    :param method: ``'exact'``, ``'table'`` (interpolated), or ``None`` (table is used for large arrays)
     :return: :math:`y(x)`
     """
+    return areaVoigt(x, A, c, wg/np.sqrt(2*_4ln2), wl/2, method=method)
+
+
+def voigtFWHM(wg, wl):
+    r"""Returns the FWHM of a Voigt profile.
+
+    Approximation by Olivero and Longbothum (accuracy of 0.02%).
+
+    .. math:: w \approx 0.5346 w_l + \sqrt{0.2166 w_l^2 + w_g^2}
+
+    :param wg: FWHM of the gaussian
+    :param wl: FWHM of the lorentzian
+    :return: FWHM
+    """
+    return 0.5346*wl + np.sqrt(0.2166*wl**2 + wg**2)
+
+
+def _voigt_derivatives(x, c, sigma, gamma):
+    """Returns Re[w(z)] and the derivatives of Re[w(z)] with respect to c, sigma, gamma."""
+    u = 1/(sigma*np.sqrt(2))
+    z = (np.asarray(x) - c + 1j*gamma)*u
+    w = wofz(z)
+    dw = -2*z*w + 2j/_sqrtpi  # w'(z)
+    return w.real, -dw.real*u, -(dw*z).real/sigma, -dw.imag*u
+
+
+def jacobianVoigt(x, amp, c, sigma, gamma):
+    r"""Jacobian of :py:func:`Voigt` with respect to amp, c, sigma, and gamma.
+
+    Useful as ``jac`` argument of ``scipy.optimize.curve_fit``.
+
+    :param x: x array
+    :param amp: Amplitude
+    :param c: Center
+    :param sigma: standard deviation of the gaussian
+    :param gamma: half width at half maximum of the lorentzian
+    :return: array with shape ``(len(x), 4)``
+    """
+    real, d_c, d_sigma, d_gamma = _voigt_derivatives(x, c, sigma, gamma)
+    u = gamma/(sigma*np.sqrt(2))
+    norm = erfcx(u)
+    d_norm = 2*u*norm - 2/_sqrtpi  # derivative of erfcx(u)
+    return np.stack([real/norm,
+                     amp*d_c/norm,
+                     amp*(d_sigma + real*d_norm*u/(sigma*norm))/norm,
+                     amp*(d_gamma - real*d_norm/(sigma*np.sqrt(2)*norm))/norm], axis=-1)
+
+
+def jacobianAreaVoigt(x, A, c, sigma, gamma):
+    r"""Jacobian of :py:func:`areaVoigt` with respect to A, c, sigma, and gamma.
+
+    Useful as ``jac`` argument of ``scipy.optimize.curve_fit``.
+
+    :param x: x array
+    :param A: Area
+    :param c: Center
+    :param sigma: standard deviation of the gaussian
+    :param gamma: half width at half maximum of the lorentzian
+    :return: array with shape ``(len(x), 4)``
+    """
+    real, d_c, d_sigma, d_gamma = _voigt_derivatives(x, c, sigma, gamma)
+    norm = 1/(sigma*_sqrt2pi)
+    return np.stack([real*norm,
+                     A*d_c*norm,
+                     A*(d_sigma - real/sigma)*norm,
+                     A*d_gamma*norm], axis=-1)
+
 
-    return amp * (np.arctan((w**-1)*(x - c)) + (np.pi/2))/np.pi
+def fwhmArctan(x, amp, c, w, *, out=None, backend=None):
+    r"""Arctangent function.
 
+    .. math:: y(x) =   \frac{A}{\pi} \left[ \arctan(\frac{1}{w}(x-c)) + \frac{\pi}{2} \right]
 
-def square(x, amp, c, w):
+    :param x: x array
+    :param amp: Amplitude
+    :param c: Center
+    :param w: FWHM (it will take fwhm units to go from amp/4 to (3amp)/4)
+    :param out: array to store the result (optional)
+    :param backend: ``'numpy'``, ``'numba'``, or None (see ``default_backend``)
+    :return: :math:`y(x)`
+    """
+    x = np.asarray(x)
+    out = _empty(x, amp, c, w, out=out)
+    if _get_backend(x, backend, out, amp, c, w) == 'numba':
+        amp, c, w_inv = _cast(out, amp, c, 1/w)
+        x_flat, out_flat = _flat(x, out)
+        _arctan_numba(x_flat, amp[()], c[()], w_inv[()], out_flat)
+        return out
+    c, w_inv, factor = _cast(out, c, 1/w, amp/np.pi)
+    np.subtract(x, c, out=out)
+    np.multiply(out, w_inv, out=out)
+    np.arctan(out, out=out)
+    np.add(out, _constants(out.dtype)['half_pi'], out=out)
+    np.multiply(out, factor, out=out)
+    return out
+
+
+def square(x, amp, c, w, *, out=None):
     r"""Square step function.
 
     .. math::
@@ -208,12 +651,31 @@ def square(x, amp, c, w):
     :param amp: Amplitude
     :param c: Center
     :param w: FWHM
+    :param out: array to store the result (optional)
     :return: :math:`y(x)`
     """
-    return - np.heaviside(x-c-w/2, amp)*amp + np.heaviside(x-c+w/2, amp)*amp
-
-
-def fwhmErr(x, amp, c, w):
+    x = np.asarray(x)
+    out = _empty(x, amp, c, w, out=out)
+    amp, start, stop = _cast(out, amp, c-w/2, c+w/2)
+    np.subtract(np.heaviside(x-start, amp), np.heaviside(x-stop, amp), out=out)
+    np.multiply(out, amp, out=out)
+    return out
+
+
+def _erf_table(tol, dtype):
+    """Returns step, values, and slopes of a uniform erf table with max. interpolation error tol."""
+    dtype = np.dtype(dtype)
+    if (tol, dtype) not in _erf_tables:
+        # linear interpolation error <= step**2/8 * max|erf''|
+        step = np.sqrt(8*tol/(4*np.exp(-0.5)/np.sqrt(2*np.pi)))
+        grid = np.linspace(-_erf_table_range, _erf_table_range, int(np.ceil(2*_erf_table_range/step)) + 1)
+        values = erf(grid)
+        slope = np.append(np.diff(values), 0)
+        _erf_tables[(tol, dtype)] = (grid[1] - grid[0], values.astype(dtype), slope.astype(dtype))
+    return _erf_tables[(tol, dtype)]
+
+
+def fwhmErr(x, amp, c, w, *, out=None, table=False, backend=None):
     r"""Error function. Integal of gaussian function calculated by ``scipy.special.erf()``.
 
     .. math:: y(x) = \frac{2}{\sqrt{\pi}} \int_0^x e^{-t^2} dt
@@ -222,6 +684,545 @@ def fwhmErr(x, amp, c, w):
     :param amp: Amplitude
     :param c: Center
     :param w: FWHM (it will take roughly fwhm units to go from amp/4 to (3amp)/4)
+    :param out: array to store the result (optional)
+    :param table: if True, erf is linearly interpolated from a precomputed table
+        (max. absolute error of ``amp*erf_table_tol/2``), which is faster for large arrays
+    :param backend: ``'numpy'``, ``'numba'``, or None (see ``default_backend``). Not used
+        if ``table=True``
     :return: :math:`y(x)`
     """
-    return amp/2 * (erf((w**-1)/2*(x - c))+1)
+    x = np.asarray(x)
+    out = _empty(x, amp, c, w, out=out)
+    if not table and _get_backend(x, backend, out, amp, c, w) == 'numba':
+        amp, c, factor = _cast(out, amp, c, 1/(2*w))
+        x_flat, out_flat = _flat(x, out)
+        _erf_numba(x_flat, amp[()], c[()], factor[()], out_flat)
+        return out
+    if table:
+        step, values, slope = _erf_table(erf_table_tol, out.dtype)
+        c, factor, offset, last = _cast(out, c, 1/(2*w*step), _erf_table_range/step, len(values)-1)
+        # out = fractional table index
+        np.subtract(x, c, out=out)
+        np.multiply(out, factor, out=out)
+        np.add(out, offset, out=out)
+        np.clip(out, 0, last, out=out)
+        i = out.astype(np.intp)
+        np.subtract(out, i, out=out)
+        scratch = _scratch(out)
+        np.multiply(np.take(slope, i, out=scratch), out, out=out)
+        np.add(out, np.take(values, i, out=scratch), out=out)
+    else:
+        c, factor = _cast(out, c, 1/(2*w))
+        np.subtract(x, c, out=out)
+        np.multiply(out, factor, out=out)
+        erf(out, out=out)
+    np.add(out, _constants(out.dtype)['one'], out=out)
+    np.multiply(out, *_cast(out, amp/2), out=out)
+    return out
+
+
+# coefficients (amp_l, amp_g, c, w2, k) of the general peak shape
+# amp_l*w2/(w2 + (x-c)**2) + amp_g*exp(-k*(x-c)**2)
+_peak_coefficients = {'Gauss':           lambda amp, c, sigma: (0, amp, c, 1, 1/(2*sigma**2)),
+                      'areaGauss':       lambda A, c, sigma: (0, A/(_sqrt2pi*sigma), c, 1, 1/(2*sigma**2)),
+                      'fwhmGauss':       lambda amp, c, w: (0, amp, c, 1, _4ln2/w**2),
+                      'fwhmAreaGauss':   lambda A, c, w: (0, A*_2sqrtln2/(w*_sqrtpi), c, 1, _4ln2/w**2),
+                      'Lorentz':         lambda gamma, c: (1/(np.pi*gamma), 0, c, gamma**2, 1),
+                      'fwhmLorentz':     lambda amp, c, w: (amp, 0, c, w**2, 1),
+                      'fwhmAreaLorentz': lambda A, c, w: (A/(np.pi*w), 0, c, w**2, 1),
+                      'fwhmVoigt':       lambda amp, c, w, m: (amp*m, amp*(1-m), c, w**2, _4ln2/w**2),
+                      'fwhmAreaVoigt':   lambda A, c, w, m: (A*m/(np.pi*w), A*(1-m)*_2sqrtln2/(w*_sqrtpi), c, w**2, _4ln2/w**2),
+                      }
+
+
+class PeakSet(object):
+    """Sum of many peaks of the same shape evaluated as one broadcast.
+
+    Peak parameters are given as arrays (one element per peak) in the same
+    order as the arguments of the corresponding model function. The
+    ``(n_peaks, n_points)`` evaluation is split in tiles with at most
+    ``block_size`` elements, so memory usage is bounded.
+
+    Example:
+        >>> peaks = PeakSet('fwhmVoigt')
+        >>> y = peaks(x, amp=[1, 2, 3], c=[0, 1, 2], w=[0.1, 0.2, 0.1], m=[0.5, 0.5, 0.2])
+
+        is the same as (but faster than)::
+
+            y = fwhmVoigt(x, 1, 0, 0.1, 0.5) + fwhmVoigt(x, 2, 1, 0.2, 0.5) + fwhmVoigt(x, 3, 2, 0.1, 0.2)
+
+    Args:
+        shape (str or function): model function (or its name). Available shapes
+            are ``Gauss``, ``areaGauss``, ``fwhmGauss``, ``fwhmAreaGauss``,
+            ``Lorentz``, ``fwhmLorentz``, ``fwhmAreaLorentz``, ``fwhmVoigt``,
+            and ``fwhmAreaVoigt``.
+        block_size (int, optional): maximum number of elements of a tile.
+    """
+
+    def __init__(self, shape='fwhmVoigt', block_size=2**16):
+        if callable(shape):
+            shape = shape.__name__
+        if shape not in _peak_coefficients:
+            raise ValueError(f"shape '{shape}' is not available. Use one of {list(_peak_coefficients)}.")
+        self.shape = shape
+        self.block_size = int(block_size)
+
+    def __repr__(self):
+        return f"PeakSet('{self.shape}')"
+
+    def __call__(self, x, *args, out=None, add=False, support=None, tol=None, **kwargs):
+        """Returns the sum of all peaks.
+
+        If ``support`` or ``tol`` is given, each peak is only evaluated within
+        a window around its center (found by ``np.searchsorted``), which is
+        much faster for sparse spectra with many narrow peaks. In this case,
+        x must be a sorted 1d array.
+
+        Args:
+            x (array): x array.
+            *args, **kwargs (list or array): peak parameters (one value per peak).
+            out (array, optional): array to store the result.
+            add (bool, optional): if True, the result is added to ``out``
+                instead of overwriting it.
+            support (number, optional): peaks are evaluated within
+                ``± support*FWHM`` of their centers.
+            tol (number, optional): peaks are evaluated where they are larger
+                than ``tol`` times their amplitude, e.g., ``tol=1e-6`` truncates
+                a gaussian at ~2.2 FWHM and a lorentzian at ~1000 HWHM. If
+                both ``support`` and ``tol`` are given, the narrower window is used.
+
+        Returns:
+            array.
+        """
+        x = np.asarray(x)
+        args = [np.asarray(arg) for arg in args]
+        kwargs = {key: np.asarray(kwargs[key]) for key in kwargs}
+        coefficients = _peak_coefficients[self.shape](*args, **kwargs)
+        dtype = _float_dtype(x)
+        amp_l, amp_g, c, w2, k = [np.atleast_1d(np.asarray(item, dtype=dtype)) for item in coefficients]
+        amp_l, amp_g, c, w2, k = np.broadcast_arrays(amp_l, amp_g, c, w2, k)
+        has_l = np.any(amp_l != 0)
+        has_g = np.any(amp_g != 0)
+
+        if out is None:
+            if add:
+                raise ValueError('out must be given if add=True.')
+            out = np.empty(x.shape, dtype=dtype)
+
+        if len(c) == 0:
+            if not add:
+                out[...] = 0
+            return out
+
+        if support is None and tol is None:
+            return self._dense(x, out, add, amp_l*w2, amp_g, c, w2, k, has_l, has_g)
+
+        # half width of the evaluation window for each peak
+        half = np.full(len(c), np.inf)
+        if support is not None:
+            hwhm = np.maximum(np.where(amp_g != 0, np.sqrt(np.log(2)/k), 0), np.where(amp_l != 0, np.sqrt(w2), 0))
+            half = 2*support*hwhm
+        if tol is not None:
+            cutoff = np.maximum(np.where(amp_g != 0, np.sqrt(np.log(1/tol)/k), 0), np.where(amp_l != 0, np.sqrt(w2*(1/tol - 1)), 0))
+            half = np.minimum(half, cutoff)
+        return self._windowed(x, out, add, amp_l*w2, amp_g, c, w2, k, half)
+
+    def _dense(self, x, out, add, amp_l, amp_g, c, w2, k, has_l, has_g):
+        """Evaluate all peaks over all points in (n_peaks, chunk) tiles."""
+        amp_l, amp_g, c, w2, k = [item[:, None] for item in (amp_l, amp_g, c, w2, k)]
+        x_flat = x.ravel()
+        out_flat = out.reshape(-1)
+        n_peaks = len(c)
+        chunk = max(1, self.block_size//n_peaks)
+        tile = np.empty((n_peaks, min(chunk, len(x_flat))), dtype=c.dtype)
+        scratch = np.empty_like(tile) if has_l and has_g else None
+
+        for start in range(0, len(x_flat), chunk):
+            x_chunk = x_flat[start:start+chunk]
+            d2 = tile[:, :len(x_chunk)]
+            np.subtract(x_chunk, c, out=d2)
+            np.square(d2, out=d2)
+            if has_g:
+                g = d2 if not has_l else scratch[:, :len(x_chunk)]
+                np.multiply(d2, -k, out=g)
+                np.exp(g, out=g)
+                np.multiply(g, amp_g, out=g)
+            if has_l:
+                np.add(d2, w2, out=d2)
+                np.divide(amp_l, d2, out=d2)
+                if has_g:
+                    np.add(d2, g, out=d2)
+            if add:
+                out_flat[start:start+chunk] += np.sum(d2, axis=0, dtype=out.dtype)
+            else:
+                np.sum(d2, axis=0, dtype=out.dtype, out=out_flat[start:start+chunk])
+        return out
+
+    def _windowed(self, x, out, add, amp_l, amp_g, c, w2, k, half):
+        """Evaluate each peak only within ``c ± half`` (x must be sorted)."""
+        if x.ndim != 1:
+            raise ValueError('x must be a 1d sorted array if support or tol is given.')
+        if not add:
+            out[:] = 0
+        start = np.searchsorted(x, c - half, side='left')
+        stop = np.searchsorted(x, c + half, side='right')
+        scratch = np.empty(np.max(stop - start, initial=0), dtype=c.dtype)
+
+        for i in np.flatnonzero(stop > start):
+            x_window = x[start[i]:stop[i]]
+            d2 = scratch[:len(x_window)]
+            np.subtract(x_window, c[i], out=d2)
+            np.square(d2, out=d2)
+            if amp_g[i] != 0:
+                y = np.exp(d2*(-k[i]))
+                y *= amp_g[i]
+                if amp_l[i] != 0:
+                    y += amp_l[i]/(d2 + w2[i])
+            else:
+                y = amp_l[i]/(d2 + w2[i])
+            out[start[i]:stop[i]] += y
+        return out
+
+
+def _kernel_get(key):
+    if key in _kernel_cache:
+        _kernel_cache.move_to_end(key)
+        return _kernel_cache[key]
+    return None
+
+
+def _kernel_set(key, value):
+    _kernel_cache[key] = value
+    if len(_kernel_cache) > _kernel_cache_size:
+        _kernel_cache.popitem(last=False)
+
+
+def _broadening_fft(n, step, sigma, dtype=float):
+    """Returns half width (in points), FFT length and kernel spectrum for an uniform grid."""
+    dtype = np.dtype(dtype)
+    key = ('fft', n, step, sigma, dtype)
+    stored = _kernel_get(key)
+    if stored is None:
+        half = max(1, int(np.ceil(broadening_cutoff*sigma/step)))
+        t = np.arange(-half, half+1)*step
+        kernel = np.exp(-t**2/(2*sigma**2))
+        kernel /= np.sum(kernel)
+        nfft = fft.next_fast_len(n + 4*half, real=True)
+        stored = (half, nfft, fft.rfft(kernel.astype(dtype), nfft))
+        _kernel_set(key, stored)
+    return stored
+
+
+def _broadening_matrix(x, sigma, dtype=float):
+    """Returns a sparse matrix that convolves data on a non-uniform grid with a gaussian."""
+    dtype = np.dtype(dtype)
+    key = ('matrix', len(x), hash(x.tobytes()), sigma, dtype)
+    stored = _kernel_get(key)
+    if stored is not None and np.array_equal(stored[0], x):
+        return stored[1]
+
+    n = len(x)
+    start = np.searchsorted(x, x - broadening_cutoff*sigma, side='left')
+    stop = np.searchsorted(x, x + broadening_cutoff*sigma, side='right')
+    counts = stop - start
+    rows = np.repeat(np.arange(n), counts)
+    cols = np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(np.sum(counts))
+
+    # trapezoidal integration weights
+    dx = np.empty(n)
+    dx[1:-1] = (x[2:] - x[:-2])/2
+    dx[0] = (x[1] - x[0])/2
+    dx[-1] = (x[-1] - x[-2])/2
+
+    values = np.exp(-(x[rows] - x[cols])**2/(2*sigma**2))*dx[cols]
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(n, n))
+    matrix = (sparse.diags(1/np.asarray(matrix.sum(axis=1)).ravel()) @ matrix).astype(dtype)
+    _kernel_set(key, (x.copy(), matrix))
+    return matrix
+
+
+def broadening(x, y, fwhm, method=None, axis=-1):
+    r"""Returns y convolved with a gaussian (e.g. an instrument resolution function).
+
+    For uniform grids the convolution is done by FFT, where the kernel
+    spectrum is cached and reused by subsequent calls with the same grid.
+    For non-uniform grids a (cached) sparse convolution matrix is used. Data
+    is padded with edge values, so that the total intensity is preserved at
+    the edges.
+
+    :param x: increasing x array
+    :param y: array. If multidimensional, data is broadened along ``axis``
+    :param fwhm: FWHM of the gaussian
+    :param method: ``'fft'`` (uniform grids only), ``'matrix'``, or ``None`` (chosen automatically)
+    :param axis: axis of y that corresponds to x
+    :return: broadened y (float32 data is broadened in single precision)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.moveaxis(np.asarray(y), axis, -1)
+    dtype = _float_dtype(y)
+    sigma = fwhm/np.sqrt(2*_4ln2)
+    n = len(x)
+    step = (x[-1] - x[0])/(n - 1)
+
+    if method is None:
+        method = 'fft' if np.allclose(np.diff(x), step, rtol=1e-6, atol=0) else 'matrix'
+
+    if method == 'fft':
+        half, nfft, kernel = _broadening_fft(n, step, sigma, dtype)
+        pad_width = [(0, 0)]*(y.ndim-1) + [(2*half, 2*half)]
+        padded = np.pad(y, pad_width, mode='edge')
+        final = fft.irfft(fft.rfft(padded, nfft, axis=-1)*kernel, nfft, axis=-1)
+        final = final[..., 3*half:3*half+n]
+    elif method == 'matrix':
+        matrix = _broadening_matrix(x, sigma, dtype)
+        final = (matrix @ y.reshape(-1, n).T).T.reshape(y.shape)
+    else:
+        raise ValueError("method must be 'fft', 'matrix', or None.")
+    return np.moveaxis(final, -1, axis)
+
+
+def broadened(function, fwhm, method=None):
+    r"""Returns a model function broadened by a gaussian instrument function.
+
+    The returned function has the same arguments of ``function``, so it can
+    wrap a single model function or a whole composite model, e.g.:
+
+        >>> fwhmVoigt_res = broadened(fwhmVoigt, fwhm=0.1)
+        >>> model = broadened(lambda x, a, b: fwhmGauss(x, a, 0, 1) + fwhmLorentz(x, b, 2, 1), fwhm=0.1)
+
+    :param function: model function ``f(x, *args)``
+    :param fwhm: FWHM of the gaussian instrument function
+    :param method: see :py:func:`broadening`
+    :return: function
+    """
+    @functools.wraps(function)
+    def wrapper(x, *args, **kwargs):
+        return broadening(x, function(x, *args, **kwargs), fwhm, method=method)
+    return wrapper
+
+
+def sigma2fwhm(sigma):
+    """Returns the FWHM of a gaussian with standard deviation sigma."""
+    return _2sqrtln2*np.sqrt(2)*sigma
+
+
+def fwhm2sigma(w):
+    """Returns the standard deviation of a gaussian with FWHM w."""
+    return w/(_2sqrtln2*np.sqrt(2))
+
+
+def pseudoVoigtFWHM(w, m, tol=1e-12):
+    r"""Returns the FWHM of :py:func:`fwhmVoigt`.
+
+    The lorentzian and gaussian parts of :py:func:`fwhmVoigt` have FWHM of
+    :math:`2w` and :math:`w`, respectively, so the FWHM of their sum is
+    found by bisection (vectorized) between these two values.
+
+    :param w: w parameter of :py:func:`fwhmVoigt`
+    :param m: Factor from 1 to 0 of the lorentzian amount (fraction of the peak height)
+    :param tol: relative tolerance
+    :return: FWHM
+    """
+    w, m = np.broadcast_arrays(np.asarray(w, dtype=float), np.asarray(m, dtype=float))
+    low, high = w/2, w.copy()
+    for _ in range(int(np.ceil(np.log2(1/tol)))):
+        t = (low + high)/2
+        half = m/(1 + (t/w)**2) + (1-m)*np.exp(-_4ln2*(t/w)**2) > 0.5
+        low = np.where(half, t, low)
+        high = np.where(half, high, t)
+    return low + high
+
+
+def propagate(function, args, cov, step=1e-6):
+    r"""Returns the standard deviation of ``function(*args)`` given the covariance of args.
+
+    Linear error propagation, :math:`\sigma^2 = J \Sigma J^T`, where the
+    gradient :math:`J` is computed by central finite differences.
+
+    :param function: function ``f(*args)``
+    :param args: parameter values
+    :param cov: covariance matrix of args (e.g. ``p_cov`` from ``curve_fit``)
+    :param step: relative step for the finite differences
+    :return: standard deviation
+    """
+    args = np.asarray(args, dtype=float)
+    gradient = np.zeros(len(args))
+    for i in np.flatnonzero(np.diag(cov)):
+        h = step*max(abs(args[i]), 1)
+        up, down = args.copy(), args.copy()
+        up[i] += h
+        down[i] -= h
+        gradient[i] = (function(*up) - function(*down))/(2*h)
+    return np.sqrt(gradient @ cov @ gradient)
+
+
+class Model(object):
+    """Metadata of a model function.
+
+    Attributes are computed only once, when the model is registered (see
+    :py:func:`register_model`).
+
+    Attributes:
+        function (function): model function ``f(x, *args)``.
+        name (str): model name.
+        args (list): names of the fitting parameters (x and keyword-only
+            arguments are not included).
+        bounds (dict): physical ``(min, max)`` of each parameter (metadata
+            only, empty min/max cells in :py:mod:`backpack.datafit` are
+            still unbounded).
+        vectorized (function or None): function that evaluates many peaks of
+            this model at once (see :py:class:`PeakSet`).
+        jacobian (function or None): ``jacobian(x, *args)`` returns an array with
+            shape ``(len(x), len(args))``.
+        fwhm (function or None): ``fwhm(*args)`` returns the FWHM.
+        area (function or None): ``area(*args)`` returns the area.
+        centroid (function or None): ``centroid(*args)`` returns the centroid.
+            If None and the model has an argument ``c``, ``c`` is used.
+    """
+
+    def __init__(self, function, name=None, bounds=None, vectorized=None, jacobian=None, fwhm=None, area=None, centroid=None):
+        self.function = function
+        self.name = function.__name__ if name is None else name
+        self.args = [name for name, p in inspect.signature(function).parameters.items() if p.kind != p.KEYWORD_ONLY][1:]
+        self.bounds = {arg: (-np.inf, np.inf) for arg in self.args}
+        if bounds is not None:
+            for arg in bounds:
+                if arg not in self.bounds:
+                    raise ValueError(f"'{arg}' is not an argument of '{self.name}'.")
+                self.bounds[arg] = tuple(bounds[arg])
+        self.vectorized = vectorized
+        self.jacobian = jacobian
+        self.fwhm = fwhm
+        self.area = area
+        if centroid is None and 'c' in self.args:
+            index = self.args.index('c')
+            centroid = lambda *args: args[index]
+        self.centroid = centroid
+
+    def __repr__(self):
+        return f"Model('{self.name}', args={self.args})"
+
+    def __call__(self, x, *args, **kwargs):
+        return self.function(x, *args, **kwargs)
+
+    def properties(self, args, cov=None):
+        """Returns area, FWHM, and centroid from closed-form expressions (no model evaluation).
+
+        Args:
+            args (list): parameter values.
+            cov (array, optional): covariance matrix of args (e.g. the
+                respective block of ``p_cov`` from ``curve_fit``). If given,
+                uncertainties are propagated (see :py:func:`propagate`).
+
+        Returns:
+            dict with keys ``area``, ``fwhm``, ``centroid`` (None if not
+            available for this model), and ``area_error``, ``fwhm_error``,
+            ``centroid_error`` if cov is given.
+        """
+        final = dict()
+        for key in ('area', 'fwhm', 'centroid'):
+            function = getattr(self, key)
+            final[key] = None if function is None else function(*args)
+            if cov is not None:
+                final[key + '_error'] = None if function is None else propagate(function, args, cov)
+        return final
+
+    def amp2area(self, amp, *args):
+        """Returns the area given the first parameter (amplitude) and the remaining parameters."""
+        return self.area(amp, *args)
+
+    def area2amp(self, area, *args):
+        """Returns the first parameter (amplitude) that gives a curve with area (remaining parameters are fixed)."""
+        return area/self.area(1, *args)
+
+
+models = dict()
+
+
+def register_model(function=None, name=None, **kwargs):
+    """Register a model function, so it can be used as a submodel in :py:mod:`backpack.datafit`.
+
+    Can be used as a decorator:
+
+        >>> @register_model(bounds={'w': (0, np.inf)})
+        ... def myPeak(x, amp, c, w):
+        ...     return amp*np.exp(-abs(x-c)/w)
+
+    Args:
+        function (function): model function ``f(x, *args)``.
+        name (str, optional): model name. If None, the function name is used.
+        **kwargs: metadata (``bounds``, ``vectorized``, ``jacobian``,
+            ``fwhm``, ``area``, ``centroid``). See :py:class:`Model`.
+
+    Returns:
+        function (unchanged).
+    """
+    if function is None:
+        return lambda function: register_model(function, name=name, **kwargs)
+    model = Model(function, name=name, **kwargs)
+    models[model.name] = model
+    return function
+
+
+def get_model(name):
+    """Returns the :py:class:`Model` registered with name."""
+    try:
+        return models[name]
+    except KeyError:
+        raise KeyError(f"Model '{name}' is not registered. Use register_model().") from None
+
+
+_positive = (0, np.inf)
+_fraction = (0, 1)
+for _function, _kwargs in [
+        (Gauss,              dict(bounds=dict(sigma=_positive),
+                                  fwhm=lambda amp, c, sigma: sigma2fwhm(sigma),
+                                  area=lambda amp, c, sigma: _sqrt2pi*amp*abs(sigma))),
+        (areaGauss,          dict(bounds=dict(sigma=_positive),
+                                  fwhm=lambda A, c, sigma: sigma2fwhm(sigma),
+                                  area=lambda A, c, sigma: A)),
+        (fwhmGauss,          dict(bounds=dict(w=_positive),
+                                  fwhm=lambda amp, c, w: w,
+                                  area=lambda amp, c, w: _sqrtpi*amp*w/_2sqrtln2)),
+        (fwhmAreaGauss,      dict(bounds=dict(w=_positive),
+                                  fwhm=lambda A, c, w: w,
+                                  area=lambda A, c, w: A)),
+        (Lorentz,            dict(bounds=dict(gamma=_positive),
+                                  fwhm=lambda gamma, c: 2*gamma,
+                                  area=lambda gamma, c: 1)),
+        (fwhmLorentz,        dict(bounds=dict(w=_positive),
+                                  fwhm=lambda amp, c, w: 2*w,
+                                  area=lambda amp, c, w: np.pi*amp*w)),
+        (fwhmAreaLorentz,    dict(bounds=dict(w=_positive),
+                                  fwhm=lambda A, c, w: 2*w,
+                                  area=lambda A, c, w: A)),
+        (fwhmVoigt,          dict(bounds=dict(w=_positive, m=_fraction),
+                                  fwhm=lambda amp, c, w, m: pseudoVoigtFWHM(w, m),
+                                  area=lambda amp, c, w, m: amp*w*(m*np.pi + (1-m)*_sqrtpi/_2sqrtln2))),
+        (fwhmAreaVoigt,      dict(bounds=dict(w=_positive, m=_fraction),
+                                  fwhm=lambda A, c, w, m: pseudoVoigtFWHM(w, m/(m + (1-m)*np.pi*_2sqrtln2/_sqrtpi)),
+                                  area=lambda A, c, w, m: A)),
+        (Voigt,              dict(bounds=dict(sigma=_positive, gamma=_positive),
+                                  jacobian=jacobianVoigt,
+                                  fwhm=lambda amp, c, sigma, gamma: voigtFWHM(sigma2fwhm(sigma), 2*gamma),
+                                  area=lambda amp, c, sigma, gamma: amp*sigma*_sqrt2pi/erfcx(gamma/(sigma*np.sqrt(2))))),
+        (areaVoigt,          dict(bounds=dict(sigma=_positive, gamma=_positive),
+                                  jacobian=jacobianAreaVoigt,
+                                  fwhm=lambda A, c, sigma, gamma: voigtFWHM(sigma2fwhm(sigma), 2*gamma),
+                                  area=lambda A, c, sigma, gamma: A)),
+        (fwhmExactVoigt,     dict(bounds=dict(wg=_positive, wl=_positive),
+                                  fwhm=lambda amp, c, wg, wl: voigtFWHM(wg, wl),
+                                  area=lambda amp, c, wg, wl: amp*fwhm2sigma(wg)*_sqrt2pi/erfcx(wl/2/(fwhm2sigma(wg)*np.sqrt(2))))),
+        (fwhmAreaExactVoigt, dict(bounds=dict(wg=_positive, wl=_positive),
+                                  fwhm=lambda A, c, wg, wl: voigtFWHM(wg, wl),
+                                  area=lambda A, c, wg, wl: A)),
+        (fwhmArctan,         dict()),
+        (square,             dict(bounds=dict(w=_positive),
+                                  fwhm=lambda amp, c, w: w,
+                                  area=lambda amp, c, w: amp*w)),
+        (fwhmErr,            dict()),
+        ]:
+    if _function.__name__ in _peak_coefficients:
+        _kwargs['vectorized'] = PeakSet(_function)
+    register_model(_function, **_kwargs)
+del _function, _kwargs
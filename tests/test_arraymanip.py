@@ -0,0 +1,147 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from backpack import arraymanip as am
+
+
+def _reference(x, y, reduction, weights):
+    x_final = np.unique(x)
+    functions = {'mean': np.mean, 'median': np.median, 'sum': np.sum}
+    if reduction == 'weighted':
+        return x_final, np.array([np.average(y[x == value], weights=weights[x == value]) for value in x_final])
+    return x_final, np.array([functions[reduction](y[x == value]) for value in x_final])
+
+
+@pytest.mark.parametrize('reduction', ['mean', 'median', 'sum', 'weighted'])
+@pytest.mark.parametrize('presorted', [False, True])
+def test_increasing_monotonicity(reduction, presorted):
+    rng = np.random.default_rng(0)
+    x = rng.integers(0, 50, 1000).astype(float)
+    y = rng.normal(size=1000)
+    weights = rng.uniform(0.5, 2, 1000)
+    if presorted:
+        order = np.argsort(x, kind='stable')
+        x, y, weights = x[order], y[order], weights[order]
+
+    x_final, y_final, counts = am.increasing_monotonicity(x, y, reduction=reduction, weights=weights, return_counts=True)
+    x_expected, y_expected = _reference(x, y, reduction, weights)
+    np.testing.assert_array_equal(x_final, x_expected)
+    np.testing.assert_allclose(y_final, y_expected, rtol=1e-12)
+    assert np.sum(counts) == len(x)
+
+
+@pytest.mark.parametrize('reduction', ['mean', 'median', 'sum', 'weighted'])
+def test_increasing_monotonicity_empty_bins(reduction):
+    x, y = [1, 2, 4, 2, 1], [5, 6, 9, 8, 9]
+    x_final, y_final = am.increasing_monotonicity(x, y, reduction=reduction, weights=np.ones(5), grid=[1, 2, 3, 4, 5])
+    assert np.all(np.isnan(y_final[[2, 4]]))
+    assert not np.any(np.isnan(y_final[[0, 1, 3]]))
+
+    x_final, y_final = am.increasing_monotonicity([], [], reduction=reduction, weights=[], grid=[1, 2])
+    assert np.all(np.isnan(y_final))
+
+
+@pytest.mark.parametrize('order', [1, 2, 3])
+def test_derivative_savgol_default_window(order):
+    x = np.linspace(0, 2, 201)
+    y = x**4
+    x_der, dy = am.derivative(x, y, order=order, method='savgol')
+    expected = {1: 4*x**3, 2: 12*x**2, 3: 24*x}[order]
+    np.testing.assert_allclose(dy[10:-10], expected[10:-10], rtol=1e-3, atol=1e-3)
+
+    with pytest.raises(ValueError, match="method='savgol'"):
+        am.derivative(x, y, order=order, method='savgol', window_size=1)
+
+
+def test_derivative_fornberg_non_uniform():
+    x = np.sort(np.random.default_rng(0).uniform(0, 2, 200))
+    x_der, dy = am.derivative(x, x**3, accuracy=4)
+    np.testing.assert_allclose(dy, 3*x**2, rtol=1e-8, atol=1e-8)
+
+
+@pytest.mark.parametrize('statistic', ['mean', 'median', 'max', 'min', 'savgol'])
+@pytest.mark.parametrize('mode', ['valid', 'same', 'reflect', 'shrink'])
+def test_moving_window_short_array(statistic, mode):
+    array = np.arange(3.0)
+    if mode == 'valid' or (mode == 'shrink' and statistic == 'savgol'):
+        with pytest.raises(ValueError, match='must be at least window_size'):
+            am.moving_window(array, 5, statistic=statistic, mode=mode)
+    else:
+        assert am.moving_window(array, 5, statistic=statistic, mode=mode).shape == (3, )
+
+
+@pytest.mark.parametrize('statistic', ['mean', 'median', 'max', 'min'])
+@pytest.mark.parametrize('mode', ['valid', 'shrink'])
+def test_moving_window_matches_loop(statistic, mode):
+    array = np.random.default_rng(0).normal(size=(2, 50))
+    window_size = 6
+    left = window_size//2
+    right = window_size - left - 1
+    function = {'mean': np.mean, 'median': np.median, 'max': np.max, 'min': np.min}[statistic]
+    if mode == 'valid':
+        expected = np.array([function(array[:, i:i+window_size], axis=-1) for i in range(50 - window_size + 1)]).T
+    else:
+        expected = np.array([function(array[:, max(i-left, 0):i+right+1], axis=-1) for i in range(50)]).T
+    np.testing.assert_allclose(am.moving_window(array, window_size, statistic=statistic, mode=mode), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('mode', ['valid', 'same', 'shrink'])
+def test_moving_window_float32_precision(mode):
+    array = (1000 + np.random.default_rng(0).normal(size=10**6)).astype(np.float32)
+    result = am.moving_window(array, 11, mode=mode)
+    assert result.dtype == np.float32
+    expected = am.moving_window(array.astype(np.float64), 11, mode=mode)
+    np.testing.assert_allclose(result, expected, atol=1e-3)
+
+
+def test_movingaverage_default_and_deprecated_flag():
+    array = np.arange(10.0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        np.testing.assert_allclose(am.movingaverage(array, 3), am.moving_window(array, 3, mode='shrink'))
+    with pytest.warns(DeprecationWarning):
+        np.testing.assert_allclose(am.movingaverage(array, 3, remove_boundary_effects=True), am.moving_window(array, 3, mode='shrink'))
+    with pytest.warns(DeprecationWarning):
+        np.testing.assert_allclose(am.movingaverage(array, 3, remove_boundary_effects=False), am.moving_window(array, 3, mode='same'))
+
+
+def test_sort_single_permutation():
+    ref = [3, 1, 2, 1]
+    x, y, z = am.sort(ref, ref, ['c', 'a', 'b', 'd'], np.arange(8).reshape(4, 2))
+    np.testing.assert_array_equal(x, [1, 1, 2, 3])
+    np.testing.assert_array_equal(y, ['a', 'd', 'b', 'c'])  # stable
+    np.testing.assert_array_equal(z, [[2, 3], [6, 7], [4, 5], [0, 1]])
+
+    (y, ), index = am.sort(ref, [30, 10, 20, 11], return_index=True)
+    np.testing.assert_array_equal(index, [1, 3, 2, 0])
+    np.testing.assert_array_equal(y, [10, 11, 20, 30])
+
+
+def test_resample_matches_interp():
+    rng = np.random.default_rng(0)
+    x = np.sort(rng.uniform(0, 10, 50))
+    y = rng.normal(size=(3, 50))
+    x_new = np.linspace(-1, 11, 97)
+    expected = np.array([np.interp(x_new, x, row) for row in y])
+    np.testing.assert_allclose(am.resample(x, y, x_new), expected, rtol=1e-12)
+    np.testing.assert_allclose(am.resample(x, y.T, x_new, axis=0), expected.T, rtol=1e-12)
+    assert am.interp_matrix(x, x_new) is am.interp_matrix(x, x_new)
+
+    final = am.resample(x, y, x_new, fill_value=np.nan)
+    outside = (x_new < x[0]) | (x_new > x[-1])
+    assert np.all(np.isnan(final[:, outside])) and not np.any(np.isnan(final[:, ~outside]))
+
+    # cubic interpolation is exact for cubic polynomials
+    np.testing.assert_allclose(am.resample(x, x**3, x_new[~outside], kind='cubic'), x_new[~outside]**3, rtol=1e-9)
+
+
+def test_rebin_conserves_integral():
+    x = np.linspace(0, 10, 101)
+    y = np.random.default_rng(0).uniform(size=(2, 101))
+    x_new = np.linspace(0, 10, 21)
+    final = am.rebin(x, y, x_new)
+    np.testing.assert_allclose(np.sum(final*np.diff(am.bin_edges(x_new)), axis=-1),
+                               np.sum(y*np.diff(am.bin_edges(x)), axis=-1), rtol=1e-12)
+    np.testing.assert_allclose(am.rebin(x, y, x), y, rtol=1e-12)
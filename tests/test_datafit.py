@@ -0,0 +1,65 @@
+import __main__
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+datafit = pytest.importorskip('backpack.datafit')
+
+
+def test_get_model_main_functions(monkeypatch):
+    monkeypatch.setattr(datafit, '_main_models', dict())
+    registered = datafit.get_model('Gauss')
+
+    def Gauss(x, amp, c, w):
+        return amp*np.exp(-abs(x - c)/w)
+    monkeypatch.setattr(__main__, 'Gauss', Gauss, raising=False)
+    model = datafit._get_model('Gauss')
+    assert model.function is Gauss
+    assert datafit._get_model('Gauss') is model
+    assert datafit.get_model('Gauss') is registered
+
+    # redefined functions get a new model
+    def Gauss(x, amp, c, w):
+        return amp*np.exp(-(x - c)**2/w)
+    monkeypatch.setattr(__main__, 'Gauss', Gauss)
+    assert datafit._get_model('Gauss').function is Gauss
+
+    monkeypatch.delattr(__main__, 'Gauss')
+    assert datafit._get_model('Gauss') is registered
+
+
+def test_get_properties():
+    amp, c, sigma = 2, 1, 0.5
+    submodel = {'index': [0, None, 1], 'model': datafit.get_model('Gauss'), 'args': [amp, c, sigma]}
+    self = SimpleNamespace(submodel={'peak': submodel}, p_cov=np.diag([0.01, 0.0025]))
+    datafit.get_properties(self)
+
+    properties = submodel['properties']
+    np.testing.assert_allclose(properties['area'], np.sqrt(2*np.pi)*amp*sigma)
+    np.testing.assert_allclose(properties['area_error'], np.sqrt(2*np.pi)*np.hypot(sigma*0.1, amp*0.05), rtol=1e-6)
+    np.testing.assert_allclose(properties['fwhm'], 2*np.sqrt(2*np.log(2))*sigma)
+    np.testing.assert_allclose(properties['fwhm_error'], 2*np.sqrt(2*np.log(2))*0.05, rtol=1e-6)
+    assert properties['centroid'] == c
+    assert properties['centroid_error'] == 0
+
+
+def test_refresh_is_deprecated():
+    with pytest.warns(DeprecationWarning):
+        datafit.refresh()
+
+
+def test_plot_fit_derivative():
+    plt = pytest.importorskip('matplotlib.pyplot')
+    x = np.linspace(-5, 5, 201)
+    y = datafit.Gauss(x, 2, 0.5, 1)
+    self = SimpleNamespace(update_model=lambda: None, model=datafit.Gauss, p_fitted=[2, 0.5, 1])
+    ax = plt.figure().add_subplot(111)
+    datafit.plot_fit(self, x, y, ax=ax, show_derivative=True, derivative_factor=1, derivative_offset=0, smoothing=0)
+
+    x_der, y_der = datafit.am.derivative(x, y)
+    exp, der, fit, fit_der = ax.lines
+    np.testing.assert_allclose(der.get_xdata(), x_der)
+    np.testing.assert_allclose(der.get_ydata(), y_der)
+    np.testing.assert_allclose(fit_der.get_ydata(), y_der)
+    plt.close('all')
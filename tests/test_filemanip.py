@@ -0,0 +1,339 @@
+import threading
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from backpack import filemanip as fm
+
+
+def _random_doubles(n, seed=0):
+    """Random doubles over the whole range (including subnormals, nan, inf)."""
+    bits = np.random.default_rng(seed).integers(0, 2**64, n, dtype=np.uint64)
+    values = bits.view(np.float64)
+    special = [0.0, -0.0, np.nan, np.inf, -np.inf, 5e-324, 1e-300, 5e295, 1.7976931348623157e308,
+               9.5, 0.5, 1e-100, 9.9999999999999e99, 1e100, 0.1, 1.0, 2.5e-5]
+    return np.concatenate((values, special, np.negative(special)))
+
+
+@pytest.mark.parametrize('flag', ['', ' ', '+'])
+@pytest.mark.parametrize('precision', [0, 3, 10, 12])
+def test_format_e_full_range(flag, precision):
+    values = _random_doubles(20000)
+    fmt = f'%{flag}.{precision}e'
+    chars = fm._format_e(values, flag, precision)
+    for i, value in enumerate(values):
+        assert chars[:, i][chars[:, i] != 0].tobytes().decode() == fmt % value
+
+
+def test_format_rows_mixed_columns():
+    data = np.array([[1.0, 2.0], [1e-300, 3.0], [5e295, 4.0], [np.nan, -1e-5]])
+    formats = ['% .10e', '%+.3e']
+    expected = ''.join(f'{formats[0] % a},{formats[1] % b}\n' for a, b in data)
+    assert fm._format_rows(data, formats, ',', '\n') == expected
+
+
+def test_save_data_round_trip_full_range(tmp_path):
+    values = _random_doubles(3000)
+    values = values[np.isfinite(values)]
+    data = np.column_stack((values, np.linspace(-1, 1, len(values))))
+    fm.save_data(data, tmp_path/'data.dat', data_format='%.16e')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        loaded = fm.load_data(tmp_path/'data.dat')
+    assert np.array_equal(loaded, data)
+
+
+def test_cache_is_not_listed(tmp_path):
+    data = {'x': np.arange(5.0), 'y': np.arange(5.0)**2}
+    for i in (1, 2):
+        fm.save_data(data, tmp_path/f'scan_00{i}.dat')
+    loaded = fm.load_data(tmp_path/'scan_001.dat', cache=True)
+    cached = fm.load_data(tmp_path/'scan_001.dat', cache=True)
+    assert np.array_equal(loaded['y'], cached['y'])
+    assert (tmp_path/'.npcache'/'scan_001.dat'/'meta.json').exists()
+
+    expected = [tmp_path/'scan_001.dat', tmp_path/'scan_002.dat']
+    assert fm.filelist(tmp_path, 'scan') == expected
+    assert fm.filelist(tmp_path, '*') == expected
+    assert fm.filelist(tmp_path, '**/*') == expected
+    assert list(fm.parsed_filelist(tmp_path, 'scan').values()) == expected
+
+
+def test_filelist_keeps_dirpath_spelling(tmp_path, monkeypatch):
+    (tmp_path/'scans').mkdir()
+    (tmp_path/'scans'/'scan_001.dat').write_text('1')
+    monkeypatch.chdir(tmp_path)
+    assert fm.filelist(tmp_path/'scans') == [tmp_path/'scans'/'scan_001.dat']
+    assert fm.filelist('scans') == [Path('scans')/'scan_001.dat']
+    assert fm.filelist('./scans/../scans') == [Path('./scans/../scans')/'scan_001.dat']
+    assert fm.parsed_filelist('scans') == {1: Path('scans')/'scan_001.dat'}
+    assert fm.parsed_filelist(tmp_path/'scans') == {1: tmp_path/'scans'/'scan_001.dat'}
+
+
+def test_filelist_missing_directory(tmp_path):
+    assert fm.filelist(tmp_path/'missing') == []
+    assert fm.filelist(tmp_path/'missing', '**/*') == []
+    assert fm.parsed_filelist(tmp_path/'missing') == {}
+    (tmp_path/'missing').mkdir()
+    (tmp_path/'missing'/'scan_001.dat').write_text('1')
+    assert fm.filelist(tmp_path/'missing') == [tmp_path/'missing'/'scan_001.dat']
+
+
+_lazy_files = {
+    'fixed': '# x,y\n 1.0e+00, 2.0e+00\n 3.0e+00, 4.0e+00\n 5.0e+00, 6.0e+00\n',
+    'variable': '# x,y,name\n1,2.5,a\n10.25,-3,bb\n\n# comment\n7,8e3,ccc',
+    'crlf': '# x,y\r\n1,2\r\n30,40\r\n5,6\r\n',
+    'missing': '# x,y\n1,2\n3,\n50,6\n',
+    'whitespace': '# x y\n  1   2\n3\t40\n# comment\n 500 6 \n',
+    'ragged': '# x,y\n1,2\n3,4,5\n6,7\n',
+    'inline comments': '# x,y,name\n1,2,a # x\n3,4,bb#,c\n5,6,c\n',
+    'fixed inline comments': '# x,y\n1,2 # x\n3,4 # y\n5,6 # z\n',
+    'whitespace inline comments': '# x y\n1 2# x\n3 4 #y\n5 6\n',
+}
+
+
+@pytest.mark.parametrize('name', list(_lazy_files))
+@pytest.mark.parametrize('block_size', [7, 2**26])
+def test_lazy_data_file_matches_load_data(tmp_path, monkeypatch, name, block_size):
+    monkeypatch.setattr(fm.LazyDataFile, '_block_size', block_size)
+    monkeypatch.setattr(fm, 'load_chunk_size', 2)
+    filepath = tmp_path/'data.dat'
+    filepath.write_bytes(_lazy_files[name].encode())
+    delimiter = ' ' if name.startswith('whitespace') else ','
+
+    if name == 'ragged':
+        with fm.LazyDataFile(filepath, delimiter=delimiter) as data:
+            assert data._index_fields() is None
+            assert data.n_rows == 3
+        return
+
+    expected = fm.load_data(filepath, delimiter=delimiter)
+    with fm.LazyDataFile(filepath, delimiter=delimiter, cache_size=1) as data:
+        assert list(data) == list(expected)
+        for key in expected:
+            if isinstance(expected[key], list):
+                assert data[key] == expected[key]
+            else:
+                np.testing.assert_array_equal(data[key], expected[key])
+        assert data.n_rows == len(expected[key])
+
+
+def test_lazy_data_file_save_data(tmp_path):
+    data = {'x': np.linspace(0, 1, 1000), 'y': np.random.default_rng(0).normal(size=1000)}
+    fm.save_data(data, tmp_path/'data.dat')
+    with fm.LazyDataFile(tmp_path/'data.dat') as lazy:
+        assert lazy._fixed and lazy._starts is None
+        for key in data:
+            np.testing.assert_allclose(lazy[key], data[key], rtol=1e-10)
+
+
+_obj = {'a': np.arange(3), 'b': {'1': [1.5, 'x', None, True], '2.0': np.float32(0.25)}, 'c': [], 'd': {}}
+
+
+@pytest.mark.parametrize('serializer', ['json', 'npz', 'msgpack'])
+@pytest.mark.parametrize('prettyPrint', [True, False])
+def test_obj_round_trip(tmp_path, serializer, prettyPrint):
+    if serializer == 'msgpack':
+        pytest.importorskip('msgpack')
+    fm.save_obj(_obj, tmp_path/'obj', serializer=serializer, prettyPrint=prettyPrint)
+    loaded = fm.load_obj(tmp_path/'obj', serializer=serializer, dict_keys_to_int=True)
+    assert list(loaded['b']) == [1, 2]
+    assert np.array_equal(loaded['a'], _obj['a'])
+    assert loaded['b'][1] == [1.5, 'x', None, True]
+    assert loaded['b'][2] == 0.25
+
+
+@pytest.mark.parametrize('prettyPrint', [True, False])
+def test_json_output_does_not_depend_on_orjson(tmp_path, monkeypatch, prettyPrint):
+    if fm.orjson is None:
+        pytest.skip('orjson is not installed')
+    fm.save_obj(_obj, tmp_path/'fast.json', prettyPrint=prettyPrint)
+    monkeypatch.setattr(fm, 'orjson', None)
+    fm.save_obj(_obj, tmp_path/'stdlib.json', prettyPrint=prettyPrint)
+    assert (tmp_path/'fast.json').read_text() == (tmp_path/'stdlib.json').read_text()
+
+
+@pytest.mark.parametrize('writer', ['orjson', 'json'])
+@pytest.mark.parametrize('reader', ['orjson', 'json'])
+@pytest.mark.parametrize('prettyPrint', [True, False])
+def test_json_non_finite_round_trip(tmp_path, monkeypatch, writer, reader, prettyPrint):
+    if 'orjson' in (writer, reader) and fm.orjson is None:
+        pytest.skip('orjson is not installed')
+    orjson = fm.orjson
+    obj = {'a': np.array([1.0, np.nan, np.inf]), 'b': float('nan'), 'c': np.float32(0.1), 'd': None}
+    if writer == 'json':
+        monkeypatch.setattr(fm, 'orjson', None)
+    fm.save_obj(obj, tmp_path/'obj.json', prettyPrint=prettyPrint)
+    monkeypatch.setattr(fm, 'orjson', orjson if reader == 'orjson' else None)
+    loaded = fm.load_obj(tmp_path/'obj.json')
+    np.testing.assert_array_equal(loaded['a'], obj['a'])
+    assert np.isnan(loaded['b'])
+    assert loaded['c'] == float(obj['c'])
+    assert loaded['d'] is None
+
+
+def test_json_indentation(tmp_path):
+    fm.save_obj({'a': [1]}, tmp_path/'obj.json')
+    assert (tmp_path/'obj.json').read_text() == '{\n    "a": [\n        1\n    ]\n}'
+
+
+def test_writer_keeps_symlink_and_mode(tmp_path):
+    target = tmp_path/'target.txt'
+    link = tmp_path/'link.txt'
+    fm.save_text('old', target)
+    target.chmod(0o640)
+    link.symlink_to(target)
+
+    fm.save_text('new', link)
+    assert link.is_symlink()
+    assert fm.load_text(target) == 'new'
+    assert target.stat().st_mode & 0o777 == 0o640
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['link.txt', 'target.txt']
+
+
+def test_writer_is_atomic(tmp_path):
+    fm.save_data(np.ones((3, 2)), tmp_path/'data.dat')
+    before = (tmp_path/'data.dat').read_text()
+
+    def blocks():
+        yield np.zeros((2, 2))
+        raise RuntimeError('interrupted')
+
+    with pytest.raises(RuntimeError):
+        fm.save_data(blocks(), tmp_path/'data.dat')
+    future = fm.save_data(blocks(), tmp_path/'data.dat', background=True)
+    assert isinstance(future.exception(), RuntimeError)
+    assert (tmp_path/'data.dat').read_text() == before
+    assert [path.name for path in tmp_path.iterdir()] == ['data.dat']
+
+
+def test_background_writes(tmp_path):
+    futures = [fm.save_text(str(i), tmp_path/f'{i}.txt', background=True, fsync=True) for i in range(5)]
+    fm.wait_writes()
+    assert all(future.done() for future in futures)
+    assert [fm.load_text(tmp_path/f'{i}.txt') for i in range(5)] == [str(i) for i in range(5)]
+
+
+def test_cache_is_refreshed(tmp_path):
+    filepath = tmp_path/'data.dat'
+    fm.save_data({'x': np.arange(3.0)}, filepath)
+    np.testing.assert_array_equal(fm.load_data(filepath, cache=True)['x'], np.arange(3.0))
+
+    fm.save_data({'x': np.arange(5.0)}, filepath)
+    np.testing.assert_array_equal(fm.load_data(filepath, cache=True)['x'], np.arange(5.0))
+    np.testing.assert_array_equal(fm.load_data(filepath, cache=True, delimiter=' ', col_labels=['x'])['x'], np.arange(5.0))
+    np.testing.assert_array_equal(fm.load_data(filepath, cache=True)['x'], np.arange(5.0))
+
+
+_codecs = {'gzip': ('.gz', None), 'zstd': ('.zst', 'zstandard'), 'lz4': ('.lz4', 'lz4.frame')}
+
+
+@pytest.fixture(params=list(_codecs))
+def codec(request):
+    suffix, module = _codecs[request.param]
+    if module is not None:
+        pytest.importorskip(module)
+    return request.param
+
+
+def test_codec_round_trip(tmp_path, codec):
+    suffix = _codecs[codec][0]
+    data = {'x': np.linspace(0, 1, 2001), 'y': np.random.default_rng(0).normal(size=2001)}
+    fm.save_data(data, tmp_path/f'data.dat{suffix}', header='scan 1\n')
+    assert fm._detect_codec(tmp_path/f'data.dat{suffix}') == codec
+    loaded = fm.load_data(tmp_path/f'data.dat{suffix}')
+    for key in data:
+        np.testing.assert_allclose(loaded[key], data[key], rtol=1e-10)
+    assert fm.load_Comments(tmp_path/f'data.dat{suffix}') == ['# scan 1\n', '# x,y\n']
+
+    # codec detected by the first bytes, appended frames
+    fm.save_data({'x': [1, 2]}, tmp_path/'data', codec=codec, level=1)
+    fm.save_data({'x': [3]}, tmp_path/'data', codec=codec, append=True)
+    np.testing.assert_array_equal(fm.load_data(tmp_path/'data')['x'], [1, 2, 3])
+
+    # missing values and strings (zstd streams are not seekable)
+    fm.save_text('# a,b,c\n1,2,x\n3,,y\n', tmp_path/f'text{suffix}')
+    assert fm.load_text(tmp_path/f'text{suffix}') == '# a,b,c\n1,2,x\n3,,y\n'
+    loaded = fm.load_data(tmp_path/f'text{suffix}')
+    np.testing.assert_array_equal(loaded['b'], [2, np.nan])
+    assert loaded['c'] == ['x', 'y']
+
+    with pytest.raises(ValueError):
+        fm.LazyDataFile(tmp_path/f'data.dat{suffix}')
+
+
+def test_codec_not_installed(tmp_path, monkeypatch):
+    monkeypatch.setattr(fm, 'zstandard', None)
+    with pytest.raises(ModuleNotFoundError):
+        fm.save_text('x', tmp_path/'text.zst')
+    with pytest.raises(ValueError):
+        fm.save_text('x', tmp_path/'text', codec='bz2')
+
+
+@pytest.mark.parametrize('delimiter', [', ', ';;', '\t'])
+def test_save_load_multi_character_delimiter(tmp_path, delimiter):
+    data = {'x': np.linspace(0, 1, 11), 'y': np.arange(11.0)}
+    fm.save_data(data, tmp_path/'data.dat', delimiter=delimiter)
+    loaded = fm.load_data(tmp_path/'data.dat', delimiter=delimiter)
+    assert list(loaded) == ['x', 'y']
+    for key in data:
+        np.testing.assert_allclose(loaded[key], data[key], rtol=1e-10)
+
+    (tmp_path/'text.dat').write_text(f'# a{delimiter}b{delimiter}c\n1{delimiter}2{delimiter}x\n3{delimiter}{delimiter}y\n')
+    loaded = fm.load_data(tmp_path/'text.dat', delimiter=delimiter)
+    np.testing.assert_array_equal(loaded['b'], [2, np.nan])
+    assert loaded['c'] == ['x', 'y']
+
+
+@pytest.mark.parametrize('text', ['1\n2\n3\n', '1,2,3\n', '1,2\n3,4\n5,6\n', '7\n'])
+def test_headerless_shape_matches_genfromtxt(tmp_path, text):
+    (tmp_path/'data.dat').write_text(text)
+    with pytest.warns(UserWarning):
+        data = fm.load_data(tmp_path/'data.dat')
+    expected = np.genfromtxt(tmp_path/'data.dat', delimiter=',')
+    assert data.shape == expected.shape
+    np.testing.assert_array_equal(data, expected)
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_load_many(tmp_path, executor):
+    for i in range(5):
+        fm.save_data({'x': np.arange(4.0), 'y': np.arange(4.0)*i}, tmp_path/f'scan_{i}.dat')
+    files = fm.parsed_filelist(tmp_path, 'scan')
+
+    data = fm.load_many(files, workers=2, executor=executor, max_pending=1)
+    assert list(data) == list(files)
+    for i in files:
+        np.testing.assert_array_equal(data[i]['y'], np.arange(4.0)*i)
+
+    stacked = fm.load_many(list(files.values()), workers=2, executor=executor, stack=True)
+    np.testing.assert_array_equal(stacked['y'], np.arange(5)[:, None]*np.arange(4.0))
+    np.testing.assert_array_equal(stacked['x'], np.tile(np.arange(4.0), (5, 1)))
+
+    with pytest.raises(ValueError):
+        fm.load_many(files, executor='cluster')
+
+
+@pytest.mark.parametrize('method', ['polling', 'watchdog'])
+def test_directory_watcher(tmp_path, method):
+    if method == 'watchdog':
+        pytest.importorskip('watchdog')
+    (tmp_path/'old.dat').write_text('old')
+    found = []
+    watcher = fm.DirectoryWatcher(tmp_path, '.dat', settle=0.2, interval=0.05, method=method)
+    thread = threading.Thread(target=watcher.run, args=(found.append, ), kwargs=dict(timeout=10))
+    thread.start()
+    try:
+        time.sleep(0.3)
+        (tmp_path/'new.dat').write_text('new')
+        (tmp_path/'new.txt').write_text('ignored')
+        deadline = time.monotonic() + 5
+        while not found and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+        thread.join()
+    assert found == [tmp_path/'new.dat']
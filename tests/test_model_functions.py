@@ -0,0 +1,227 @@
+import numpy as np
+import pytest
+
+from backpack import model_functions as mf
+
+
+_shapes = ['Gauss', 'areaGauss', 'fwhmGauss', 'fwhmAreaGauss', 'Lorentz', 'fwhmLorentz', 'fwhmAreaLorentz', 'fwhmVoigt', 'fwhmAreaVoigt']
+
+
+@pytest.mark.parametrize('shape', _shapes)
+@pytest.mark.parametrize('kwargs', [dict(), dict(support=5), dict(tol=1e-6)])
+def test_peak_set_empty(shape, kwargs):
+    x = np.linspace(-5, 5, 101)
+    n_args = len(mf.get_model(shape).args)
+    peaks = mf.PeakSet(shape, block_size=16)
+
+    y = peaks(x, *[[]]*n_args, **kwargs)
+    np.testing.assert_array_equal(y, np.zeros_like(x))
+
+    out = np.ones_like(x)
+    peaks(x, *[[]]*n_args, out=out, add=True, **kwargs)
+    np.testing.assert_array_equal(out, np.ones_like(x))
+
+
+@pytest.mark.parametrize('shape', _shapes)
+def test_peak_set_matches_sum(shape):
+    x = np.linspace(-5, 5, 101)
+    model = mf.get_model(shape)
+    rng = np.random.default_rng(0)
+    args = [rng.uniform(0.2, 1, 7) for arg in model.args]
+    if 'm' in model.args:
+        args[model.args.index('m')] = rng.uniform(0, 1, 7)
+
+    expected = sum(model(x, *peak) for peak in zip(*args))
+    np.testing.assert_allclose(mf.PeakSet(shape, block_size=16)(x, *args), expected, rtol=1e-10, atol=1e-12)
+
+
+def test_voigt_array_parameters():
+    x = np.linspace(-10, 10, 101)
+    sigma, gamma = np.linspace(0.5, 1.5, 101), np.linspace(0.1, 2, 101)
+    expected = [mf.Voigt(x[i], 1, 0, sigma[i], gamma[i], method='exact') for i in range(len(x))]
+    np.testing.assert_allclose(mf.Voigt(x, 1, 0, sigma, gamma), expected, rtol=1e-12)
+    assert mf.Voigt(x[:, None], 1, 0, np.array([0.5, 1]), np.array([0.2, 1])).shape == (101, 2)
+
+
+def test_voigt_table_is_cached():
+    x = np.linspace(-20, 20, 10001)
+    y = mf.Voigt(x, 1, 0.3, 1, 0.5, method='table')
+    np.testing.assert_allclose(y, mf.Voigt(x, 1, 0.3, 1, 0.5, method='exact'), atol=1e-4)
+
+    tables = [key for key in mf._kernel_cache if key[0] == 'voigt']
+    stored = mf._kernel_cache[tables[-1]]
+    np.testing.assert_array_equal(mf.Voigt(x[100:-100], 1, 0.3, 1, 0.5, method='table'), y[100:-100])
+    assert mf._kernel_cache[tables[-1]] is stored
+
+
+@pytest.mark.parametrize('shape, args', [('Gauss', [2, 1, 0.5]),
+                                         ('Voigt', [2, 1, 0.5, 0.3]),
+                                         ('fwhmVoigt', [2, 1, 0.5, 0.3]),
+                                         ('fwhmAreaVoigt', [2, 1, 0.5, 0.3])])
+def test_properties_match_numerical(shape, args):
+    model = mf.get_model(shape)
+    x = np.linspace(-2000, 2000, 4000001)
+    y = model.function(x, *args)
+    properties = model.properties(args)
+
+    np.testing.assert_allclose(properties['area'], np.trapezoid(y, x), rtol=1e-3)
+    above = x[y >= np.max(y)/2]
+    np.testing.assert_allclose(properties['fwhm'], above[-1] - above[0], atol=2e-3)
+    assert properties['centroid'] == args[1]
+
+
+def test_properties_error_propagation():
+    amp, c, sigma = 2, 1, 0.5
+    cov = np.array([[0.01, 0, 0.001], [0, 0.04, 0], [0.001, 0, 0.0025]])
+    properties = mf.get_model('Gauss').properties([amp, c, sigma], cov=cov)
+
+    gradient = np.sqrt(2*np.pi)*np.array([sigma, 0, amp])
+    np.testing.assert_allclose(properties['area_error'], np.sqrt(gradient @ cov @ gradient), rtol=1e-6)
+    np.testing.assert_allclose(properties['fwhm_error'], 2*np.sqrt(2*np.log(2))*0.05, rtol=1e-6)
+    np.testing.assert_allclose(properties['centroid_error'], 0.2, rtol=1e-6)
+
+    # Voigt area is proportional to amp
+    args = [2, 1, 0.5, 0.3]
+    cov = np.diag([0.01, 0, 0, 0])
+    properties = mf.get_model('Voigt').properties(args, cov=cov)
+    np.testing.assert_allclose(properties['area_error'], properties['area']/args[0]*0.1, rtol=1e-6)
+    assert properties['fwhm_error'] == 0
+
+
+_references = {
+    'Gauss':           ([2, 0.5, 0.7],      lambda x, amp, c, sigma: amp*np.exp(-(x-c)**2/(2*sigma**2))),
+    'fwhmGauss':       ([2, 0.5, 0.7],      lambda x, amp, c, w: amp*np.exp(-4*np.log(2)*(x-c)**2/w**2)),
+    'Lorentz':         ([0.7, 0.5],         lambda x, gamma, c: gamma/(np.pi*(gamma**2 + (x-c)**2))),
+    'fwhmLorentz':     ([2, 0.5, 0.7],      lambda x, amp, c, w: amp*w**2/(w**2 + (x-c)**2)),
+    'fwhmVoigt':       ([2, 0.5, 0.7, 0.3], lambda x, amp, c, w, m: amp*(m*w**2/(w**2 + (x-c)**2) + (1-m)*np.exp(-4*np.log(2)*(x-c)**2/w**2))),
+    'fwhmAreaVoigt':   ([2, 0.5, 0.7, 0.3], lambda x, A, c, w, m: A*(m*w/(np.pi*(w**2 + (x-c)**2)) + (1-m)*2*np.sqrt(np.log(2)/np.pi)/w*np.exp(-4*np.log(2)*(x-c)**2/w**2))),
+}
+
+
+@pytest.mark.parametrize('shape', list(_references))
+@pytest.mark.parametrize('backend', ['numpy', 'numexpr', 'numba'])
+def test_kernels_match_reference(shape, backend):
+    if backend != 'numpy':
+        pytest.importorskip(backend)
+    args, reference = _references[shape]
+    function = mf.get_model(shape).function
+    x = np.linspace(-5, 5, 2000).reshape(2, -1)
+    expected = reference(x, *args)
+    np.testing.assert_allclose(function(x, *args, backend=backend), expected, rtol=1e-12)
+
+    out = np.empty_like(x)
+    assert function(x, *args, out=out, backend=backend) is out
+    np.testing.assert_allclose(out, expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('shape', ['fwhmGauss', 'fwhmVoigt'])
+def test_peak_set_truncated(shape):
+    x = np.linspace(0, 100, 20001)
+    rng = np.random.default_rng(0)
+    amp, c, w = rng.uniform(0.5, 1, 50), rng.uniform(0, 100, 50), rng.uniform(0.05, 0.2, 50)
+    args = [amp, c, w] if shape == 'fwhmGauss' else [amp, c, w, rng.uniform(0, 1, 50)]
+    peaks = mf.PeakSet(shape)
+    expected = peaks(x, *args)
+
+    tol = 1e-6
+    assert np.max(np.abs(peaks(x, *args, tol=tol) - expected)) <= len(amp)*tol
+    if shape == 'fwhmGauss':
+        np.testing.assert_allclose(peaks(x, *args, support=5), expected, rtol=0, atol=1e-20)
+
+    out = np.ones_like(x)
+    peaks(x, *args, out=out, add=True, tol=tol)
+    assert np.max(np.abs(out - 1 - expected)) <= len(amp)*tol
+
+
+@pytest.mark.parametrize('method', ['fft', 'matrix'])
+def test_broadening_gaussians(method):
+    x = np.linspace(-10, 10, 2001)
+    if method == 'matrix':
+        x = np.sign(x)*np.abs(x)**1.2/10**0.2  # non-uniform grid
+    y = mf.fwhmAreaGauss(x, 1, 0.5, 1)
+    expected = mf.fwhmAreaGauss(x, 1, 0.5, np.hypot(1, 0.5))
+    final = mf.broadening(x, np.stack([y, 2*y]), 0.5, method=method)
+    np.testing.assert_allclose(final[0], expected, atol=1e-4)
+    np.testing.assert_allclose(final[1], 2*expected, atol=2e-4)
+    np.testing.assert_allclose(mf.broadening(x, np.stack([y, 2*y]).T, 0.5, method=method, axis=0), final.T)
+
+
+def test_broadened_keeps_signature():
+    function = mf.broadened(mf.fwhmAreaGauss, 0.5)
+    assert mf.get_model('fwhmAreaGauss').args == mf.Model(function).args
+    x = np.linspace(-10, 10, 2001)
+    np.testing.assert_allclose(function(x, 1, 0, 1), mf.fwhmAreaGauss(x, 1, 0, np.hypot(1, 0.5)), atol=1e-4)
+
+
+def test_erf_table():
+    from scipy.special import erf
+    x = np.linspace(-20, 20, 100001)
+    amp, c, w = 3, 1, 2
+    expected = amp/2*(erf((x - c)/(2*w)) + 1)
+    np.testing.assert_allclose(mf.fwhmErr(x, amp, c, w), expected, rtol=1e-12)
+    assert np.max(np.abs(mf.fwhmErr(x, amp, c, w, table=True) - expected)) <= amp*mf.erf_table_tol/2
+
+
+@pytest.mark.parametrize('shape, kwargs', [('fwhmErr', dict()), ('fwhmErr', dict(table=True)), ('fwhmArctan', dict()), ('square', dict())])
+def test_steps_out_buffer(shape, kwargs):
+    function = mf.get_model(shape).function
+    x = np.linspace(-5, 5, 1001)
+    expected = function(x, 2, 0.5, 1, **kwargs)
+    out = np.full_like(x, np.nan)
+    assert function(x, 2, 0.5, 1, out=out, **kwargs) is out
+    np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize('shape', list(_references) + ['Voigt', 'fwhmErr', 'fwhmArctan', 'square'])
+def test_float32_is_preserved(shape):
+    model = mf.get_model(shape)
+    args = _references[shape][0] if shape in _references else [2, 0.123, 0.7, 0.3][:len(model.args)]  # square edges are not on x
+    x = np.linspace(-5, 5, 1001)
+    expected = model.function(x, *args)
+    final = model.function(x.astype(np.float32), *args)
+    assert final.dtype == np.float32
+    np.testing.assert_allclose(final, expected, rtol=1e-4, atol=1e-6)
+
+
+def test_float32_peak_set_and_broadening():
+    x = np.linspace(-5, 5, 1001)
+    args = [[1, 2], [0, 1], [0.5, 0.7], [0.3, 0.6]]
+    peaks = mf.PeakSet('fwhmVoigt')
+    expected = peaks(x, *args)
+    assert peaks(x.astype(np.float32), *args).dtype == np.float32
+
+    # float32 tiles are accumulated in a float64 out
+    out = np.zeros_like(x)
+    peaks(x.astype(np.float32), *args, out=out)
+    np.testing.assert_allclose(out, expected, rtol=1e-4, atol=1e-6)
+
+    final = mf.broadening(x, expected.astype(np.float32), 0.5)
+    assert final.dtype == np.float32
+    np.testing.assert_allclose(final, mf.broadening(x, expected, 0.5), rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.parametrize('shape', ['fwhmErr', 'fwhmArctan'])
+def test_numba_steps_match_numpy(shape):
+    pytest.importorskip('numba')
+    function = mf.get_model(shape).function
+    x = np.linspace(-5, 5, 2000).reshape(2, -1)
+    for dtype in (np.float64, np.float32):
+        expected = function(x.astype(dtype), 2, 0.5, 0.7, backend='numpy')
+        final = function(x.astype(dtype), 2, 0.5, 0.7, backend='numba')
+        assert final.dtype == dtype
+        if dtype == np.float64:
+            np.testing.assert_allclose(final, expected, rtol=1e-12)
+        else:
+            np.testing.assert_allclose(final, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_numba_fallback():
+    x = np.linspace(-5, 5, 101)
+    c = np.linspace(-1, 1, 101)
+    # array parameters and non-contiguous out are evaluated by numpy
+    np.testing.assert_allclose(mf.fwhmGauss(x, 2, c, 0.7, backend='numba'), mf.fwhmGauss(x, 2, c, 0.7, backend='numpy'))
+    out = np.empty((101, 2)).T
+    mf.fwhmGauss(np.stack([x, x]), 2, 0.5, 0.7, out=out, backend='numba')
+    np.testing.assert_allclose(out[0], mf.fwhmGauss(x, 2, 0.5, 0.7))
+    with pytest.raises(ValueError):
+        mf.fwhmGauss(x, 2, 0.5, 0.7, backend='cuda')